@@ -0,0 +1,195 @@
+#!/usr/bin/python
+
+"""Benchmarks of the similarity engines on synthetic MeSH/OMIM fixtures.
+
+For every fixture size and measure, times the stages of
+ComputeSimilarities (parse, annotate, per descriptor, per object, ISM and
+write) and writes the results as JSON:
+
+    {"environment": {...}, "fixtures": {...},
+     "results": [{"size": ..., "measure": ..., "stage": ..., "seconds": ...}, ...]}
+
+The time of a stage is the best of --repeat runs. With --compare, the
+results are checked against a previous JSON file and the stages slower by
+more than --tolerance are reported as regressions (exit status 1).
+
+For the term-wise measures, per_descriptor_default and per_object_default
+time compute_semantic_similarity_per_descriptor and
+compute_semantic_similarity_per_object_termwise, the path taken by
+compute_matrices for a single measure and by compute_combined_similarity;
+per_descriptor and per_object time the information content path.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ComputeSimilarities'))
+
+from synthetic import generate_mesh, generate_annotation
+from mesh_parser import MeSHParser
+from annotation import AnnotationParser
+from semsim import InformationContent, AnnotationIncidence, compute_per_object_termwise
+from similarity_measures import Resnik, Lin, Jiang, Schlicker, SimUI, SimGIC, ISM
+from writeFiles import writeTriplet
+
+#fixture presets: (descriptors, diseases)
+SIZES = {
+    'small': (500, 200),
+    'medium': (2000, 1000),
+    'large': (8000, 4000),
+}
+MEASURES = {
+    'RESNIK': (Resnik, 'MED'), 'LIN': (Lin, 'MED'), 'JIANG': (Jiang, 'MED'), 'SCHLICKER': (Schlicker, 'MAX'),
+    'SIMUI': (SimUI, None), 'SIMGIC': (SimGIC, None),
+}
+CATEGORY = 'C'
+STAGES = ['parse', 'annotate', 'per_descriptor_default', 'per_object_default', 'per_descriptor', 'per_object', 'ism',
+          'write']
+
+
+def timed(function, repeat):
+    """(best time in seconds, result of the last call)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def make_fixture(directory, size, seed):
+    (descriptors, objects) = SIZES[size]
+    mesh_file = os.path.join(directory, size + '_mesh.bin')
+    annotation_file = os.path.join(directory, size + '_annotation.txt')
+    mapping = generate_mesh(mesh_file, descriptors=descriptors, seed=seed)
+    generate_annotation(annotation_file, list(mapping), objects=objects, seed=seed)
+    return mesh_file, annotation_file
+
+
+def benchmark_size(size, mesh_file, annotation_file, measures, repeat, ism, workdir):
+    """Times every stage of every measure on a fixture. Returns the result records."""
+    results = []
+
+    def record(measure, stage, seconds):
+        results.append({'size': size, 'measure': measure, 'stage': stage, 'seconds': seconds})
+        print('%-8s %-10s %-22s %10.4fs' % (size, measure, stage, seconds))
+
+    (seconds, thesaurus) = timed(lambda: MeSHParser(mesh_file, list('ACDEG')).get_thesaurus(False), repeat)
+    record('-', 'parse', seconds)
+    (seconds, annotation) = timed(lambda: AnnotationParser(thesaurus, annotation_file).get_annotations(CATEGORY), repeat)
+    record('-', 'annotate', seconds)
+
+    for measure in measures:
+        (method, strategy) = MEASURES[measure]
+        if strategy is None:
+            #disease-wise measures: the per descriptor stage is the incidence matrix.
+            sem_sim = method(thesaurus, annotation)
+            (seconds, incidence) = timed(lambda: AnnotationIncidence(annotation, sem_sim.objects, sem_sim.descriptors), repeat)
+            record(measure, 'per_descriptor', seconds)
+            (seconds, _) = timed(lambda: sem_sim.compute_semantic_similarity_per_object_diseasewise_from_incidence(incidence), repeat)
+            record(measure, 'per_object', seconds)
+            per_object = sem_sim.get_perObject()
+        else:
+            sem_sim = method(thesaurus, annotation, strategy)
+            (seconds, _) = timed(sem_sim.compute_semantic_similarity_per_descriptor, repeat)
+            record(measure, 'per_descriptor_default', seconds)
+            #writes ./localStore/sim_distribution
+            (seconds, _) = timed(sem_sim.compute_semantic_similarity_per_object_termwise, repeat)
+            record(measure, 'per_object_default', seconds)
+
+            def per_descriptor():
+                information_content = InformationContent(thesaurus, annotation, sem_sim.descriptors)
+                sem_sim.compute_semantic_similarity_per_descriptor_from_information_content(information_content)
+            (seconds, _) = timed(per_descriptor, repeat)
+            record(measure, 'per_descriptor', seconds)
+            (seconds, matrices) = timed(lambda: compute_per_object_termwise([(sem_sim, [strategy])]), repeat)
+            record(measure, 'per_object', seconds)
+            per_object = matrices[(0, strategy)]
+        if ism:
+            def compute_ism():
+                values = ISM(thesaurus, annotation, per_object)
+                values.ism()
+                return values
+            (seconds, _) = timed(compute_ism, repeat)
+            record(measure, 'ism', seconds)
+        #writeTriplet writes to ./localStore
+        (seconds, _) = timed(lambda: writeTriplet(size + '_' + measure, per_object, sem_sim), repeat)
+        record(measure, 'write', seconds)
+    return results
+
+
+def compare(results, previous, tolerance):
+    """Returns the records of `results` slower than in `previous` by more than tolerance."""
+    baseline = dict(((r['size'], r['measure'], r['stage']), r['seconds']) for r in previous['results'])
+    regressions = []
+    for r in results:
+        before = baseline.get((r['size'], r['measure'], r['stage']))
+        if before is not None and r['seconds'] > before * (1.0 + tolerance):
+            regressions.append(dict(r, baseline=before, ratio=r['seconds'] / max(before, 1e-12)))
+    return regressions
+
+
+def environment():
+    import scipy
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'platform': platform.platform(), 'processor': platform.processor(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description="Benchmarks the similarity engines on synthetic fixtures")
+    aparser.add_argument("output", help="JSON file for the results")
+    aparser.add_argument("--sizes", default='small', help="comma separated fixture sizes: " + ', '.join(SIZES) + " (default: small)")
+    aparser.add_argument("--measures", default=','.join(MEASURES), help="comma separated measures (default: all)")
+    aparser.add_argument("--repeat", type=int, default=3, help="runs of every stage, the best is kept (default: 3)")
+    aparser.add_argument("--ism", action="store_true", help="also time the ISM (slow)")
+    aparser.add_argument("--seed", type=int, default=0, help="seed of the fixtures (default: 0)")
+    aparser.add_argument("--compare", help="previous results; stages slower than them are reported as regressions")
+    aparser.add_argument("--tolerance", type=float, default=0.2,
+                         help="relative slowdown tolerated by --compare (default: 0.2)")
+    args = aparser.parse_args()
+
+    sizes = [s.strip().lower() for s in args.sizes.split(',') if s.strip()]
+    measures = [m.strip().upper() for m in args.measures.split(',') if m.strip()]
+    for name in sizes:
+        if name not in SIZES:
+            aparser.error('unknown size ' + name)
+    for name in measures:
+        if name not in MEASURES:
+            aparser.error('unknown measure ' + name)
+
+    output = os.path.abspath(args.output)
+    results = []
+    fixtures = dict()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, 'localStore'))
+        os.chdir(workdir)
+        try:
+            for size in sizes:
+                (mesh_file, annotation_file) = make_fixture(workdir, size, args.seed)
+                fixtures[size] = {'descriptors': SIZES[size][0], 'diseases': SIZES[size][1], 'seed': args.seed}
+                results.extend(benchmark_size(size, mesh_file, annotation_file, measures, args.repeat, args.ism, workdir))
+        finally:
+            os.chdir(cwd)
+
+    with open(output, 'w') as f:
+        json.dump({'environment': environment(), 'fixtures': fixtures, 'repeat': args.repeat, 'results': results},
+                  f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print('REGRESSION %s %s %s: %.4fs (was %.4fs, x%.2f)' % (r['size'], r['measure'], r['stage'],
+                                                                    r['seconds'], r['baseline'], r['ratio']))
+        if regressions:
+            sys.exit(1)
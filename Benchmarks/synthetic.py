@@ -0,0 +1,149 @@
+#!/usr/bin/python
+
+"""Synthetic MeSH and OMIM fixtures for the benchmarks.
+
+generate_mesh writes a descriptor file in the ASCII MeSH format read by
+ComputeSimilarities/mesh_parser.py. Every category has a few trees whose
+descriptors are laid out breadth first with a heavy-tailed fan-out (many
+leaves, a few large hubs) up to a maximum depth, and a fraction of the
+descriptors get a second tree number under another node, which gives the
+multi-parent DAG structure of MeSH.
+
+generate_annotation writes an annotation file in the format produced by
+MIM2MESH.py:
+
+    mim\tdescriptor\t...\tdescriptor
+
+with a (Poisson) number of descriptors per disease, drawn with Zipf-like
+popularity, so a few descriptors annotate most of the diseases.
+"""
+
+import numpy as np
+
+#tree positions of MeSH: C01.123.456
+TREE_FORMAT = '%s%02d'
+CHILD_FORMAT = '%s.%03d'
+
+
+def generate_tree_positions(rng, categories, descriptors, trees, max_depth, fan_out):
+    """
+    Tree positions of `descriptors` nodes spread over the categories,
+    breadth first. Returns the list of the tree roots and the list of the
+    other positions, in creation order (parents before children).
+    """
+    roots = []
+    positions = []
+    per_category = max(descriptors // len(categories), trees)
+    for category in categories:
+        frontier = [TREE_FORMAT % (category, t + 1) for t in range(trees)]
+        roots.extend(frontier)
+        budget = per_category - trees
+        depth = 0
+        while frontier and budget > 0 and depth < max_depth:
+            next_frontier = []
+            for parent in frontier:
+                #heavy tailed: most nodes have few children, some have many.
+                children = min(int(rng.pareto(1.5) * fan_out / 3.0) + 1, budget)
+                for c in range(children):
+                    position = CHILD_FORMAT % (parent, c + 1)
+                    positions.append(position)
+                    next_frontier.append(position)
+                budget -= children
+                if budget <= 0:
+                    break
+            frontier = next_frontier
+            depth += 1
+    return roots, positions
+
+
+def generate_mesh(filename, categories='ACDEG', descriptors=2000, trees=3, max_depth=9,
+                  fan_out=4, multi_parent=0.3, seed=0):
+    """
+    Writes a synthetic MeSH descriptor file. Returns {descriptor: [tree positions]}
+    of the descriptors that are not tree roots (the ones that can annotate).
+    """
+    rng = np.random.RandomState(seed)
+    (roots, positions) = generate_tree_positions(rng, list(categories), descriptors, trees, max_depth, fan_out)
+    records = []
+    for position in roots:
+        records.append([position])
+    descriptor_positions = []
+    for position in positions:
+        descriptor_positions.append([position])
+    #multi-parent: a second tree number, a new child of a node created earlier
+    #(parents are always created before their children, so this keeps a DAG).
+    children = dict()
+    for k in np.flatnonzero(rng.rand(len(descriptor_positions)) < multi_parent):
+        if k == 0:
+            continue
+        parent = positions[rng.randint(k)]
+        if descriptor_positions[k][0].startswith(parent + '.'):
+            #already a descendant.
+            continue
+        children[parent] = children.get(parent, 0) + 1
+        descriptor_positions[k].append(CHILD_FORMAT % (parent, 900 + children[parent]))
+    records.extend(descriptor_positions)
+
+    mapping = dict()
+    with open(filename, 'w') as f:
+        for number, record in enumerate(records):
+            identifier = 'D%06d' % (number + 1)
+            f.write('*NEWRECORD\nRECTYPE = D\nMH = Synthetic descriptor %d\n' % (number + 1))
+            for position in record:
+                f.write('MN = ' + position + '\n')
+            f.write('UI = ' + identifier + '\n\n')
+            if number >= len(roots):
+                mapping[identifier] = record
+    return mapping
+
+
+def generate_annotation(filename, descriptors, objects=1000, terms=8, zipf=1.1, seed=0):
+    """
+    Writes a synthetic annotation of `objects` diseases with, on average,
+    `terms` descriptors each (at least one), chosen with probability
+    proportional to rank^-zipf.
+    """
+    rng = np.random.RandomState(seed)
+    descriptors = sorted(descriptors)
+    popularity = 1.0 / np.arange(1, len(descriptors) + 1) ** zipf
+    popularity = popularity[rng.permutation(len(descriptors))]
+    popularity /= popularity.sum()
+    sizes = np.minimum(np.maximum(rng.poisson(terms, size=objects), 1), len(descriptors))
+    with open(filename, 'w') as f:
+        for number, size in enumerate(sizes):
+            chosen = rng.choice(len(descriptors), size=size, replace=False, p=popularity)
+            f.write('%d\t%s\n' % (100000 + number, '\t'.join(descriptors[k] for k in sorted(chosen))))
+
+
+def write_tree_positions(filename, mapping):
+    """descriptor -> tree positions file, as used by SimpleSimilarities."""
+    with open(filename, 'w') as f:
+        for descriptor in sorted(mapping):
+            f.write(descriptor + '\t' + '\t'.join(mapping[descriptor]) + '\n')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    aparser = argparse.ArgumentParser(description="Generates a synthetic MeSH descriptor file and OMIM annotation")
+    aparser.add_argument("mesh_file", help="output MeSH descriptor file (ASCII MeSH format)")
+    aparser.add_argument("annotation_file", help="output annotation file: mim\\tdescriptor\\t...\\tdescriptor")
+    aparser.add_argument("--tree-positions", help="also write the descriptor -> tree positions file")
+    aparser.add_argument("--categories", default='ACDEG', help="MeSH categories (default: ACDEG)")
+    aparser.add_argument("--descriptors", type=int, default=2000, help="number of descriptors (default: 2000)")
+    aparser.add_argument("--trees", type=int, default=3, help="trees per category (default: 3)")
+    aparser.add_argument("--max-depth", type=int, default=9, help="maximum depth of the trees (default: 9)")
+    aparser.add_argument("--fan-out", type=float, default=4, help="scale of the number of children (default: 4)")
+    aparser.add_argument("--multi-parent", type=float, default=0.3,
+                         help="fraction of descriptors with a second tree position (default: 0.3)")
+    aparser.add_argument("--objects", type=int, default=1000, help="number of diseases (default: 1000)")
+    aparser.add_argument("--terms", type=float, default=8, help="mean number of descriptors per disease (default: 8)")
+    aparser.add_argument("--zipf", type=float, default=1.1, help="exponent of the descriptor popularity (default: 1.1)")
+    aparser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    args = aparser.parse_args()
+
+    mapping = generate_mesh(args.mesh_file, args.categories, args.descriptors, args.trees, args.max_depth,
+                            args.fan_out, args.multi_parent, args.seed)
+    generate_annotation(args.annotation_file, list(mapping), args.objects, args.terms, args.zipf, args.seed)
+    if args.tree_positions:
+        write_tree_positions(args.tree_positions, mapping)
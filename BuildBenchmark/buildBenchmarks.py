@@ -25,78 +25,137 @@ __license__ = "GPL"
 __version__ = "3"
 
 
+import os
 import sys
-import itertools
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import loaders
+import binary_format
+
+#lines read at once from the triplet files.
+READ_CHUNK = 8 * 1024 * 1024
+#rows (first disease of the pairs) of the benchmark table formatted at once.
+WRITE_ROWS = 256
+LINE_FORMAT = "%i\t%i\t%f\t%f\n"
 
 def readDiseasesWithProteins(filename):
-    values = set()
-    with open(filename, 'r') as f:
-        for line in f:
-            values.add(int(line.strip()))
-    return values
+    return loaders.read_column(filename, int)
 
-def get_ids_from_file(filename):
+def read_triplets(filename):
     """
-    Reads a matrix file and gets in a set
-    all the elements in the first two columns
-    (i.e. OMIM diseases)
+    Reads a triplet file (OMIM_ID_1 OMIM_ID_2 VALUE) in a single pass into
+    arrays: (omim1, omim2, values). Binary triplet files (.npd) are mapped
+    and decoded instead.
     """
-    ids_in_file = set()
-    with open(filename, 'r') as f:
-        for line in f:
-            (omim1, omim2, _) = line.split()
-            ids_in_file.add(int(omim1))
-            ids_in_file.add(int(omim2))
-    return ids_in_file
-
-def extract_subset(filename, ids):
-    matrix = {}
+    if binary_format.is_binary(filename):
+        triplets = binary_format.Triplets(filename)
+        ids = np.array(triplets.ids, dtype=np.int64)
+        (first, second) = triplets.codes()
+        return ids[first], ids[second], np.asarray(triplets.values, dtype=np.float64)
+    omim1 = []
+    omim2 = []
+    values = []
     with open(filename, 'r') as f:
-        for line in f:
-            (omim1, omim2, simi) = line.strip().split()
-            omim1 = int(omim1)
-            omim2 = int(omim2)
-            if omim1 in ids and omim2 in ids and omim1 != omim2:
-                mini, maxi = sorted([omim1, omim2])
-                matrix[(mini,maxi)] = float(simi) 
-    return matrix
-
- 
-def print_intersection_matrix(file1, file2, ids, output):
+        while True:
+            lines = f.readlines(READ_CHUNK)
+            if not lines:
+                break
+            tokens = ''.join(lines).split()
+            omim1.append(np.array(tokens[0::3], dtype=np.int64))
+            omim2.append(np.array(tokens[1::3], dtype=np.int64))
+            values.append(np.array(tokens[2::3], dtype=np.float64))
+    if not values:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+    return np.concatenate(omim1), np.concatenate(omim2), np.concatenate(values)
+
+def pack_pairs(omim1, omim2):
+    """Packed uint64 keys of unordered pairs: (min << 32) | max, sorted as (min, max)."""
+    low = np.minimum(omim1, omim2).astype(np.uint64)
+    high = np.maximum(omim1, omim2).astype(np.uint64)
+    return (low << np.uint64(32)) | high
+
+def extract_subset(triplets, ids):
+    """
+    Pairs of the triplets with both diseases in `ids` (a sorted array) and
+    different, as sorted packed keys and their values. Pairs repeated in
+    the file (in either order) keep the last value.
+    """
+    (omim1, omim2, values) = triplets
+    keep = np.isin(omim1, ids) & np.isin(omim2, ids) & (omim1 != omim2)
+    keys = pack_pairs(omim1[keep], omim2[keep])
+    values = values[keep]
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    values = values[order]
+    #the last of every run of equal keys; no pairs give an empty mask.
+    last = np.ones(len(keys), dtype=bool)
+    last[:-1] = keys[1:] != keys[:-1]
+    return keys[last], values[last]
+
+def lookup(keys, values, pairs):
+    """Values of the packed `pairs` in (keys, values), 0 for the missing ones."""
+    found = np.zeros(len(pairs))
+    if len(keys):
+        position = np.minimum(np.searchsorted(keys, pairs), len(keys) - 1)
+        hit = keys[position] == pairs
+        found[hit] = values[position[hit]]
+    return found
+
+def write_table(out, pairs, subset_disim, subset_ground_truth):
+    simi_disim = lookup(subset_disim[0], subset_disim[1], pairs)
+    simi_ground_truth = lookup(subset_ground_truth[0], subset_ground_truth[1], pairs)
+    id1 = (pairs >> np.uint64(32)).astype(np.int64)
+    id2 = (pairs & np.uint64(0xffffffff)).astype(np.int64)
+    out.write(''.join(LINE_FORMAT % row for row in zip(id1.tolist(), id2.tolist(), simi_disim.tolist(), simi_ground_truth.tolist())))
+
+def print_intersection_matrix(file1, file2, diseases_with_proteins, output, sparse=False):
     """
-    Take the matrix file `file1` and the matrix file
-    `file2`, the intersection set of OMIM ids `ids`
-    and the name of the output file, and prints an
-    output file
-        OMIM_ID_1   OMIM_ID_2   SIM_1   SIM2 
+    Take the matrix file `file1` (ground truth) and the matrix file `file2`
+    (similarity), the set of OMIM ids with proteins and the name of the
+    output file, and prints an output file
+        OMIM_ID_1   OMIM_ID_2   SIM_2   SIM_1
         ...
-    where for every pair of OMIM disease ids in the
-    intersection (columns 1 and 2) prints to the output
-    file the similarities in the first file and in 
-    the second file in columns 3 and 4, respectively.
-
-    For our proposed measure, we need to satisfy three criteria:
-
+    where for every pair of OMIM disease ids in the intersection of the ids
+    of `file2` and `diseases_with_proteins` (columns 1 and 2) prints the
+    similarity in the second file and in the first file, 0 if absent. Each
+    file is read once; the pairs are packed in uint64 keys and joined with
+    sorted searches. If `sparse`, only the pairs present in either file are
+    printed.
     """
-    matrix_ground_truth = extract_subset(file1, ids)
-    matrix_disim = extract_subset(file2, ids)
+    similarity = read_triplets(file2)
+    ids = np.union1d(similarity[0], similarity[1])
+    print("Number of OMIM ids in ", file2, ": ", len(ids))
+    ids = np.intersect1d(ids, np.fromiter(diseases_with_proteins, dtype=np.int64, count=len(diseases_with_proteins)))
+
+    subset_disim = extract_subset(similarity, ids)
+    del similarity
+    subset_ground_truth = extract_subset(read_triplets(file1), ids)
 
     with open(output, 'w') as out:
-        list_ids = sorted(list(ids))
-        for (id1, id2) in itertools.combinations(list_ids, 2):
-            simi_disim = matrix_disim[(id1, id2)] if (id1, id2) in matrix_disim else 0.0
-            simi_ground_truth = matrix_ground_truth[(id1, id2)] if (id1, id2) in matrix_ground_truth else 0.0
-            out.write("%i\t%i\t%f\t%f\n" % (id1, id2, simi_disim, simi_ground_truth))
-                    
+        if sparse:
+            pairs = np.union1d(subset_disim[0], subset_ground_truth[0])
+            for start in range(0, len(pairs), WRITE_ROWS * 1024):
+                write_table(out, pairs[start:start + WRITE_ROWS * 1024], subset_disim, subset_ground_truth)
+            return
+        #every pair of ids, in the order of itertools.combinations
+        n = len(ids)
+        for start in range(0, n, WRITE_ROWS):
+            rows = []
+            for i in range(start, min(start + WRITE_ROWS, n)):
+                rows.append(pack_pairs(np.full(n - i - 1, ids[i]), ids[i + 1:]))
+            if rows:
+                write_table(out, np.concatenate(rows), subset_disim, subset_ground_truth)
+
 
 help_string = """ 
-        Use: python buildBenchmarks.py  ground_truth_file similarity_file filtered_mimtoprot destination_dir filename_modifier
+        Use: python buildBenchmarks.py  ground_truth_file similarity_file filtered_mimtoprot destination_dir filename_modifier [--sparse]
 
             ground_truth_file: Molecular similarity file. Format:
                 OMIM_ID_1\\tOMIM_ID_2\\t1/0
 
             similarity_file: Disease similarity file produced by compute_combined_similarities.py, compute_matrices.py, simple_similarities.py. Format:
                 OMIM_ID_1\\tOMIM_ID_2\\tSIM
+            Both triplet files can also be binary triplet files (.npd, see Common/binary_format.py).
 
             filtered_mimtoprot: File mapping OMIM diseases to UniProt Indentifiers. Format:
                 OMIM1\\tUNIPROT1
@@ -105,20 +164,22 @@ help_string = """
             
             destination_dir: Location of the result files.
             filename_modifier: String appended to the end of the file.
+
+            --sparse: only write the pairs present in the ground truth or in the similarity file,
+                instead of every pair of testable OMIM ids.
     """
 
 
 if __name__ == "__main__":
+    sparse = '--sparse' in sys.argv
+    sys.argv = [arg for arg in sys.argv if arg != '--sparse']
     if (len(sys.argv) != 6):
         print(help_string)
         sys.exit(-1)
 
-    #get the ids in the similarity file.
-    ids_in_2 = get_ids_from_file(sys.argv[2])
-    print("Number of OMIM ids in ", sys.argv[2], ": ", len(ids_in_2))
     #get the diseaes with proteins.
     diseases_with_proteins = readDiseasesWithProteins(sys.argv[3])
-    #compute the intersection.
-    testeable_omims = ids_in_2 & diseases_with_proteins
-    #print "Common OMIM ids " + str(len(intersection))
-    print_intersection_matrix(sys.argv[1], sys.argv[2], testeable_omims, sys.argv[4] + sys.argv[2].split('/')[-1] + '_' + sys.argv[5])
+    name = sys.argv[2].rstrip('/').split('/')[-1]
+    if name.endswith(binary_format.SUFFIX):
+        name = name[:-len(binary_format.SUFFIX)]
+    print_intersection_matrix(sys.argv[1], sys.argv[2], diseases_with_proteins, sys.argv[4] + name + '_' + sys.argv[5], sparse)
@@ -0,0 +1,225 @@
+"""
+    Compares the measures on the benchmarks
+    Copyright (C) 2015 Horacio Caniza
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+__author__  = "Horacio Caniza"
+__email__   = "h.j.canizavierci@cs.rhul.ac.uk"
+__copyright__ = "Copyright (C) 2015 Horacio Caniza"
+__license__ = "GPL"
+__version__ = "3"
+
+"""
+Bootstrap confidence intervals of the AUROC of several measures on the same
+benchmark, and of their differences, from the tables of buildBenchmarks.py
+(one per measure)
+
+    OMIM_ID_1   OMIM_ID_2   DISIM   MOLSIM
+
+The tables are compared on the pairs they have in common, with the ground
+truth (MOLSIM > 0) of the first one. The pairs of a disease are not
+independent, so the bootstrap resamples diseases: a replicate draws the
+diseases with replacement and a pair (a, b) weighs count(a) * count(b).
+Every measure sees the same replicates, so the differences are paired.
+
+The AUROC is rank based (Mann-Whitney, ties count a half): the scores of
+every measure are ranked once, and a replicate only sums the weights of
+the positives and negatives of every rank, for a batch of replicates at
+once. The replicates are split in chunks, each with its own seed spawned
+from --seed, computed in parallel; the results do not depend on --jobs.
+"""
+
+import os
+import sys
+import numpy as np
+from multiprocessing import Pool
+
+from buildBenchmarks import pack_pairs
+
+#lines read at once from the benchmark tables.
+READ_CHUNK = 8 * 1024 * 1024
+#replicates of a chunk, the unit of work of the processes.
+CHUNK_REPLICATES = 50
+#bound on the replicates x pairs weights held at once.
+BATCH_ELEMENTS = 1 << 24
+
+
+def read_table(filename):
+    """(packed pairs, scores, labels) of a benchmark table, sorted by pair; repeated pairs keep the last line."""
+    keys = []
+    scores = []
+    labels = []
+    with open(filename, 'r') as f:
+        while True:
+            lines = f.readlines(READ_CHUNK)
+            if not lines:
+                break
+            tokens = ''.join(lines).split()
+            keys.append(pack_pairs(np.array(tokens[0::4], dtype=np.int64), np.array(tokens[1::4], dtype=np.int64)))
+            scores.append(np.array(tokens[2::4], dtype=np.float64))
+            labels.append(np.array(tokens[3::4], dtype=np.float64) > 0)
+    if not keys:
+        return np.array([], dtype=np.uint64), np.array([]), np.array([], dtype=bool)
+    keys = np.concatenate(keys)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    #the last of every run of equal keys; no pairs give an empty mask.
+    last = np.ones(len(keys), dtype=bool)
+    last[:-1] = keys[1:] != keys[:-1]
+    return keys[last], np.concatenate(scores)[order][last], np.concatenate(labels)[order][last]
+
+
+def align(tables):
+    """
+    Pairs common to all the tables: (disease index of both members of the
+    pairs, number of diseases, labels, [scores of every table]).
+    """
+    common = tables[0][0]
+    for (keys, _, _) in tables[1:]:
+        common = np.intersect1d(common, keys, assume_unique=True)
+    scores = [values[np.searchsorted(keys, common)] for (keys, values, _) in tables]
+    labels = tables[0][2][np.searchsorted(tables[0][0], common)]
+    (ids, diseases) = np.unique(np.concatenate([common >> np.uint64(32), common & np.uint64(0xffffffff)]),
+                                return_inverse=True)
+    return diseases[:len(common)], diseases[len(common):], len(ids), labels, scores
+
+
+def ranks(scores):
+    """Rank (group of tied scores, ascending) of every pair and the number of ranks."""
+    (unique, groups) = np.unique(scores, return_inverse=True)
+    return groups, len(unique)
+
+
+def weighted_auc(groups, n_groups, labels, weights):
+    """
+    AUROC of every row of `weights` (replicates x pairs): the weighted
+    probability that a positive scores above a negative, ties a half.
+    """
+    B = weights.shape[0]
+    flat = (np.arange(B)[:, None] * n_groups + groups[None, :]).ravel()
+    positives = np.bincount(flat, weights=(weights * labels).ravel(), minlength=B * n_groups).reshape(B, n_groups)
+    negatives = np.bincount(flat, weights=(weights * ~labels).ravel(), minlength=B * n_groups).reshape(B, n_groups)
+    below = np.cumsum(negatives, axis=1) - negatives
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (positives * (below + 0.5 * negatives)).sum(axis=1) / (positives.sum(axis=1) * negatives.sum(axis=1))
+
+
+def measure_aucs(measures, labels, weights):
+    """AUROC of every measure, (groups, n_groups) of its ranks, for the replicates x pairs weights."""
+    return np.column_stack([weighted_auc(groups, n_groups, labels, weights) for (groups, n_groups) in measures])
+
+
+_data = None
+
+
+def _initialise(data):
+    global _data
+    _data = data
+
+
+def bootstrap_chunk(arguments):
+    """AUROC of every measure (replicates x measures) for `replicates` replicates drawn with `seed`."""
+    (replicates, seed) = arguments
+    (first, second, n_diseases, labels, measures) = _data
+    rng = np.random.default_rng(seed)
+    batch = max(1, BATCH_ELEMENTS // max(len(labels), 1))
+    values = np.empty((replicates, len(measures)))
+    for start in range(0, replicates, batch):
+        size = min(batch, replicates - start)
+        draws = rng.integers(n_diseases, size=(size, n_diseases))
+        counts = (np.arange(size)[:, None] * n_diseases + draws).ravel()
+        counts = np.bincount(counts, minlength=size * n_diseases).reshape(size, n_diseases).astype(np.float64)
+        values[start:start + size] = measure_aucs(measures, labels, counts[:, first] * counts[:, second])
+    return values
+
+
+def bootstrap(first, second, n_diseases, labels, scores, replicates, seed=0, jobs=1):
+    """(AUROC of every measure, replicates x measures AUROC of the bootstrap replicates)."""
+    measures = [ranks(s) for s in scores]
+    data = (first, second, n_diseases, labels, measures)
+    _initialise(data)
+    estimate = measure_aucs(measures, labels, np.ones((1, len(labels))))[0]
+    sizes = [min(CHUNK_REPLICATES, replicates - start) for start in range(0, replicates, CHUNK_REPLICATES)]
+    chunks = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    if jobs <= 1 or len(chunks) <= 1:
+        values = [bootstrap_chunk(chunk) for chunk in chunks]
+    else:
+        with Pool(min(jobs, len(chunks)), initializer=_initialise, initargs=(data,)) as pool:
+            values = pool.map(bootstrap_chunk, chunks, chunksize=1)
+    return estimate, np.concatenate(values) if values else np.empty((0, len(scores)))
+
+
+def summarise(names, estimate, values, alpha):
+    """
+    Rows (comparison, estimate, low, high, p value) for every measure and
+    every pair of measures (difference of their AUROC); the interval is the
+    percentile interval of level 1 - alpha and the p value the two sided
+    bootstrap p value of a zero difference.
+    """
+    rows = []
+    quantiles = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    for m, name in enumerate(names):
+        (low, high) = np.nanpercentile(values[:, m], quantiles) if len(values) else (np.nan, np.nan)
+        rows.append((name, estimate[m], low, high, np.nan))
+    for a in range(len(names)):
+        for b in range(a + 1, len(names)):
+            difference = values[:, a] - values[:, b]
+            difference = difference[~np.isnan(difference)]
+            if len(difference):
+                (low, high) = np.percentile(difference, quantiles)
+                p_value = min(1.0, 2 * min(np.mean(difference <= 0), np.mean(difference >= 0)))
+            else:
+                (low, high, p_value) = (np.nan, np.nan, np.nan)
+            rows.append((names[a] + '-' + names[b], estimate[a] - estimate[b], low, high, p_value))
+    return rows
+
+
+def write_summary(filename, rows):
+    with open(filename, 'w') as out:
+        out.write('comparison\tauroc\tlow\thigh\tp_value\n')
+        for row in rows:
+            out.write(row[0] + '\t' + '\t'.join('%.6f' % v for v in row[1:]) + '\n')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    aparser = argparse.ArgumentParser(description="Bootstrap confidence intervals of the AUROC of measures on a benchmark "
+                                                  "and of their differences, resampling diseases")
+    aparser.add_argument("summary", help="output file: comparison, AUROC (or difference), interval and p value")
+    aparser.add_argument("benchmarks", nargs="+", help="benchmark tables of buildBenchmarks.py, one per measure")
+    aparser.add_argument("--names", help="comma separated names of the measures (default: the file names)")
+    aparser.add_argument("--replicates", type=int, default=1000, help="bootstrap replicates (default: 1000)")
+    aparser.add_argument("--alpha", type=float, default=0.05, help="1 - level of the intervals (default: 0.05)")
+    aparser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    aparser.add_argument("--jobs", "-j", type=int, default=1, help="processes computing the replicates (default: 1)")
+    args = aparser.parse_args()
+
+    names = [os.path.basename(f) for f in args.benchmarks]
+    if args.names:
+        names = [n.strip() for n in args.names.split(',')]
+        if len(names) != len(args.benchmarks):
+            aparser.error('--names needs a name per benchmark table')
+    (first, second, n_diseases, labels, scores) = align([read_table(f) for f in args.benchmarks])
+    print('Pairs in common:', len(labels), 'positives:', int(labels.sum()), 'diseases:', n_diseases)
+    if not len(labels):
+        sys.exit('The benchmark tables have no pairs in common')
+    (estimate, values) = bootstrap(first, second, n_diseases, labels, scores, args.replicates, args.seed, args.jobs)
+    rows = summarise(names, estimate, values, args.alpha)
+    write_summary(args.summary, rows)
+    for row in rows:
+        print('%-40s %.4f [%.4f, %.4f]' % row[:4])
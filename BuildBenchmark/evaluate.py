@@ -0,0 +1,182 @@
+"""
+    Evaluates the benchmarks
+    Copyright (C) 2015 Horacio Caniza
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+__author__  = "Horacio Caniza"
+__email__   = "h.j.canizavierci@cs.rhul.ac.uk"
+__copyright__ = "Copyright (C) 2015 Horacio Caniza"
+__license__ = "GPL"
+__version__ = "3"
+
+"""
+Scores the benchmark tables written by buildBenchmarks.py (and filtered by
+filterBenchmarks.py)
+
+    OMIM_ID_1   OMIM_ID_2   DISIM   MOLSIM
+
+ranking the pairs by DISIM, the similarity of the measure, against MOLSIM,
+the ground truth (a pair is positive if MOLSIM > 0): AUROC, AUPRC (average
+precision) and the precision of the top k pairs.
+
+The pairs are grouped by score: exactly, with a single sort of the distinct
+scores, or, with `bins`, in equal width score bins counted while streaming
+the table, which needs no memory per pair. Pairs with the same score (or
+bin) are tied; the precision at k counts the positives of a tie crossing k
+in proportion.
+"""
+
+import os
+import sys
+import numpy as np
+from multiprocessing import Pool
+
+#lines read at once from the benchmark tables.
+READ_CHUNK = 8 * 1024 * 1024
+SUMMARY_COLUMNS = ['file', 'pairs', 'positives', 'auroc', 'auprc']
+
+
+def read_columns(filename):
+    """Yields the (scores, labels) of the benchmark table `filename`, a chunk of lines at a time."""
+    with open(filename, 'r') as f:
+        while True:
+            lines = f.readlines(READ_CHUNK)
+            if not lines:
+                break
+            tokens = ''.join(lines).split()
+            yield np.array(tokens[2::4], dtype=np.float64), np.array(tokens[3::4], dtype=np.float64) > 0
+
+
+def exact_counts(filename):
+    """(positives, pairs) per distinct score, from the highest score to the lowest."""
+    scores = []
+    labels = []
+    for (s, l) in read_columns(filename):
+        scores.append(s)
+        labels.append(l)
+    if not scores:
+        return np.zeros(0), np.zeros(0)
+    (_, groups) = np.unique(-np.concatenate(scores), return_inverse=True)
+    labels = np.concatenate(labels)
+    return np.bincount(groups, weights=labels), np.bincount(groups).astype(np.float64)
+
+
+def binned_counts(filename, bins):
+    """(positives, pairs) per score bin, from the highest bin to the lowest. Reads the table twice."""
+    low = np.inf
+    high = -np.inf
+    for (s, _) in read_columns(filename):
+        if len(s):
+            low = min(low, s.min())
+            high = max(high, s.max())
+    positives = np.zeros(bins)
+    pairs = np.zeros(bins)
+    if low > high:
+        return positives, pairs
+    width = (high - low) / bins or 1.0
+    for (s, l) in read_columns(filename):
+        #bin 0 holds the highest scores.
+        groups = np.clip(((high - s) / width).astype(np.int64), 0, bins - 1)
+        positives += np.bincount(groups, weights=l, minlength=bins)
+        pairs += np.bincount(groups, minlength=bins)
+    return positives, pairs
+
+
+def metrics(positives, pairs, top_k=()):
+    """
+    AUROC, AUPRC and precision at every k of `top_k` of a ranking given as
+    its (positives, pairs) per group of tied pairs, best group first.
+    """
+    tp = np.cumsum(positives)
+    total = np.cumsum(pairs)
+    fp = total - tp
+    P = tp[-1] if len(tp) else 0.0
+    N = fp[-1] if len(fp) else 0.0
+    values = {'pairs': int(total[-1]) if len(total) else 0, 'positives': int(P)}
+    if P and N:
+        #trapezoids of the ROC curve; a group of ties is a diagonal segment.
+        tpr = np.concatenate([[0.0], tp / P])
+        fpr = np.concatenate([[0.0], fp / N])
+        values['auroc'] = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    else:
+        values['auroc'] = float('nan')
+    if P:
+        values['auprc'] = float(np.sum(positives[pairs > 0] / P * (tp / np.maximum(total, 1))[pairs > 0]))
+    else:
+        values['auprc'] = float('nan')
+    for k in top_k:
+        if not len(total) or k > total[-1]:
+            values['p@%d' % k] = float('nan')
+            continue
+        #the group where the top k ends.
+        g = np.searchsorted(total, k)
+        before = total[g - 1] if g else 0.0
+        before_tp = tp[g - 1] if g else 0.0
+        values['p@%d' % k] = float((before_tp + (k - before) * positives[g] / pairs[g]) / k)
+    return values
+
+
+def evaluate(filename, top_k=(), bins=0):
+    """Metrics of the benchmark table `filename` (see metrics), exact unless bins > 0."""
+    counts = binned_counts(filename, bins) if bins else exact_counts(filename)
+    values = metrics(counts[0], counts[1], top_k)
+    values['file'] = filename
+    return values
+
+
+def _evaluate(arguments):
+    return evaluate(*arguments)
+
+
+def evaluate_files(filenames, top_k=(), bins=0, jobs=1):
+    """Metrics of every file, `jobs` files at a time in separate processes."""
+    arguments = [(filename, top_k, bins) for filename in filenames]
+    if jobs <= 1 or len(filenames) <= 1:
+        return [_evaluate(a) for a in arguments]
+    with Pool(min(jobs, len(filenames))) as pool:
+        return pool.map(_evaluate, arguments, chunksize=1)
+
+
+def write_summary(filename, results, top_k=()):
+    """Writes a row per evaluated file, tab separated, with a header."""
+    columns = SUMMARY_COLUMNS + ['p@%d' % k for k in top_k]
+    with open(filename, 'w') as out:
+        out.write('\t'.join(columns) + '\n')
+        for values in results:
+            row = [os.path.basename(values['file']), str(values['pairs']), str(values['positives'])]
+            row.extend('%.6f' % values[c] for c in columns[3:])
+            out.write('\t'.join(row) + '\n')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    aparser = argparse.ArgumentParser(description="Computes AUROC, AUPRC and precision at k of benchmark tables "
+                                                  "(OMIM_ID_1 OMIM_ID_2 DISIM MOLSIM, see buildBenchmarks.py)")
+    aparser.add_argument("summary", help="output file, a row of metrics per benchmark table")
+    aparser.add_argument("benchmarks", nargs="+", help="benchmark tables")
+    aparser.add_argument("--top-k", default='100,1000', help="comma separated k of the precision at k (default: 100,1000)")
+    aparser.add_argument("--bins", type=int, default=0,
+                         help="group the scores in this many bins while streaming instead of sorting them (default: 0, exact)")
+    aparser.add_argument("--jobs", "-j", type=int, default=1, help="tables evaluated in parallel (default: 1)")
+    args = aparser.parse_args()
+
+    top_k = [int(k) for k in args.top_k.split(',') if k.strip()]
+    results = evaluate_files(args.benchmarks, top_k, args.bins, args.jobs)
+    write_summary(args.summary, results, top_k)
+    for values in results:
+        print('%s\tAUROC %.4f\tAUPRC %.4f' % (os.path.basename(values['file']), values['auroc'], values['auprc']))
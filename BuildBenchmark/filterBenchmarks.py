@@ -24,40 +24,28 @@ __copyright__ = "Copyright (C) 2015 Horacio Caniza"
 __license__ = "GPL"
 __version__ = "3"
 
-from collections import defaultdict
+import os
 import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import loaders
+
+#lines of the benchmark filtered at once.
+READ_CHUNK = 8 * 1024 * 1024
 
 
 def readUniprotPfamMapping(filename, invalid_pfams):
-    values = set()
-    with open(filename, 'r') as f:
-        for line in f:
-            #skip comments
-            if line[0] == "#" or line[0] == "":
-                continue
-            #get the different fields.
-            sl = line.strip().split()
-            #check if the pfam is not invalid.
-            if sl[6].strip().upper() not in invalid_pfams:
-                values.add(sl[0].split('|')[1])
-    return values
+    (proteins, families) = loaders.read_pfam_scan(filename)
+    #the proteins with a pfam that is not invalid.
+    return set(protein for (protein, family) in zip(proteins, families) if family not in invalid_pfams)
 
 
 def readInvalidPfam(filename):
-    values = set()
-    with open(filename, 'r') as f:
-        for line in f:
-            values.add(line.strip())
-    return values
+    return loaders.read_column(filename)
 
 
 def readOmimToEntity(filename):
-    values = defaultdict(set)
-    with open(filename, 'r') as f:
-        for line in f:
-            (omim, entity) = line.strip().split()
-            values[omim].add(entity)
-    return values
+    return loaders.read_pairs_mapping(filename, set)
 
 
 def writeLine(fp, omim1, omim2, disim, molsim):
@@ -80,9 +68,78 @@ def filterFile(filename, omim_uniprot, valid_uniprot, outfile_name):
             elif valid_uniprot:
                 #since omim_pfam contains the valid pfams for each disease, whenever a disease appears, it is valid.
                 if (omim_uniprot[omim1] & valid_uniprot) and (omim_uniprot[omim2] & valid_uniprot) and not (omim_uniprot[omim1] & omim_uniprot[omim2]):
-                    writeLine(omim1,omim2,disim,molsim)
+                    writeLine(outfile, omim1,omim2,disim,molsim)
             #we are done!
 
+
+class SharedEntityIndex(object):
+    """
+    Diseases of an OMIM -> entity mapping ({omim: entities} or a
+    loaders.EncodedMapping) as rows of a sparse disease x entity incidence
+    matrix M. The pairs of diseases sharing an entity are
+    the nonzeros of M.Mt, kept as sorted packed keys (row * n + column).
+    """
+    def __init__(self, omim_entity, valid_entities=None):
+        mapping = omim_entity
+        if not isinstance(mapping, loaders.EncodedMapping):
+            mapping = loaders.EncodedMapping.from_mapping(omim_entity)
+        self.omims = mapping.keys
+        self.index = dict(zip(self.omims, range(len(self.omims))))
+        n = len(self.omims)
+        M = mapping.matrix()
+        shared = (M @ M.T).tocoo()
+        self.n = n
+        self.shared = np.sort(shared.row.astype(np.int64) * n + shared.col)
+        #diseases with at least one valid entity, if there is a restriction.
+        self.has_valid = np.ones(n, dtype=bool)
+        if valid_entities:
+            valid = np.array([entity in valid_entities for entity in mapping.values], dtype=np.float64)
+            self.has_valid = (M @ valid) > 0
+
+    def indexes(self, omims):
+        """Rows of the diseases, -1 for the ones that are not in the mapping."""
+        (unique, inverse) = np.unique(np.asarray(omims), return_inverse=True)
+        rows = np.array([self.index.get(omim, -1) for omim in unique.tolist()], dtype=np.int64)
+        return rows[inverse]
+
+    def share(self, rows1, rows2):
+        """Whether the pairs of rows share an entity."""
+        known = (rows1 >= 0) & (rows2 >= 0)
+        keys = rows1 * self.n + rows2
+        found = np.zeros(len(keys), dtype=bool)
+        if len(self.shared):
+            position = np.minimum(np.searchsorted(self.shared, keys), len(self.shared) - 1)
+            found = self.shared[position] == keys
+        return found & known
+
+    def valid(self, rows):
+        return (rows >= 0) & self.has_valid[np.maximum(rows, 0)]
+
+
+def filterFileSparse(filename, omim_uniprot, valid_uniprot, outfile_name):
+    """
+    Same as filterFile: the shared proteins of all the pairs come from a
+    single sparse product (SharedEntityIndex) and the benchmark is filtered
+    a chunk of lines at a time with vectorised masks.
+    """
+    index = SharedEntityIndex(omim_uniprot, valid_uniprot)
+    with open(filename,'r') as infile, open(outfile_name, 'w') as outfile:
+        while True:
+            lines = infile.readlines(READ_CHUNK)
+            if not lines:
+                break
+            fields = ''.join(lines).split()
+            omim1 = fields[0::4]
+            omim2 = fields[1::4]
+            rows1 = index.indexes(omim1)
+            rows2 = index.indexes(omim2)
+            keep = ~index.share(rows1, rows2)
+            if valid_uniprot:
+                keep &= index.valid(rows1) & index.valid(rows2)
+            disim = fields[2::4]
+            molsim = fields[3::4]
+            outfile.write(''.join("%s\t%s\t%s\t%s\n" % (omim1[k], omim2[k], disim[k], molsim[k]) for k in np.flatnonzero(keep).tolist()))
+
 help_str = """
 Use: python filterBenchmarks.py file_to_filter omim_uniprot [uniprot_pfam_table invalid_pfams]
 
@@ -116,7 +173,7 @@ if __name__ == "__main__":
 
     #read omim to uniprot mapping
     print('Reading omim_to_uniprot..')
-    omim_uniprot_mapping = readOmimToEntity(omim_uniprot_file)
+    omim_uniprot_mapping = loaders.read_encoded_pairs(omim_uniprot_file)
     #check if omim to pfam is required.
     valid_uniprots_pfam = set()
     invalid_pfam = []
@@ -124,8 +181,8 @@ if __name__ == "__main__":
         print('Reading invalid pfams..')
         invalid_pfam = readInvalidPfam(invalid_pfam_file)
         print('Reading uniprot to pfam mapping..')
-        valid_uniprots = readUniprotPfamMapping(uniprot_pfam_file, invalid_pfam)
+        valid_uniprots_pfam = readUniprotPfamMapping(uniprot_pfam_file, invalid_pfam)
 
     #read the file to filter, considering the filters and produceoutput.
     print('Filtering file..')
-    filterFile(file_to_filter, omim_uniprot_mapping, valid_uniprots_pfam, file_to_filter+'-filter')
+    filterFileSparse(file_to_filter, omim_uniprot_mapping, valid_uniprots_pfam, file_to_filter+'-filter')
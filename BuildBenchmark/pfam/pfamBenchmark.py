@@ -1,6 +1,11 @@
 from collections import defaultdict
-from itertools import combinations
+import os
 import sys
+import numpy as np
+import scipy.sparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import loaders
+import binary_format
 
 """
     Produce the pfam benchmark
@@ -27,54 +32,62 @@ __copyright__ = "Copyright (C) 2015 Horacio Caniza"
 __license__ = "GPL"
 __version__ = "3"
 
+#diseases whose row of the family-sharing product is computed at once.
+BLOCK_SIZE = 2048
+
 
 def readPfamScan(filename):
     values = defaultdict(set)
-    with open(filename, 'r') as f:
-        for line in f:
-            if line[0] == "#" or line[0] == "":
-                continue
-            sl = line.strip().split()
-            values[sl[0].split('|')[1]].add(sl[6].strip().upper())
+    for (protein, family) in zip(*loaders.read_pfam_scan(filename)):
+        values[protein].add(family)
     return values
 
 def readMimToProt(filename):
-    values = defaultdict(list)
-    with open(filename, 'r') as f:
-        for line in f:
-            sl = line.strip().split()
-            values[sl[0]].append(sl[1])
-    return values
+    return loaders.read_pairs_mapping(filename, list)
 
 def readExclusionList(filename):
-    values = set()
-    with open(filename, 'r') as f:
-        for line in f:
-            values.add(line.strip().upper())
-    return values
+    return set(family.upper() for family in loaders.read_column(filename))
+
+def diseasePfamMatrix(pfamscan, mimtoprot, exclusion, omims):
+    """
+    Sparse incidence matrix of the pfam families of the proteins of every
+    disease (rows in the order of `omims`), without the excluded families.
+    """
+    families = dict()
+    rows = []
+    cols = []
+    for i, omim in enumerate(omims):
+        for protein in mimtoprot[omim]:
+            for family in pfamscan.get(protein, ()):
+                if family not in exclusion:
+                    rows.append(i)
+                    cols.append(families.setdefault(family, len(families)))
+    M = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(omims), len(families)))
+    #a protein or two proteins of the disease may carry the same family.
+    M.data[:] = 1
+    return M
 
 def produceBenchmark(pfamscan, mimtoprot, exclusion, outfile_name):
-    valid_pairs = list()
-    with open(outfile_name,'w') as f:
-        for (omim1, omim2) in combinations(sorted(mimtoprot.keys()), 2):
-            #get the proteins
-            proteins_omim1 = mimtoprot[omim1]
-            #get the families
-            families_omim1 = set()
-            for protein in proteins_omim1:
-                families_omim1.update(pfamscan[protein])
-            #get the proteins for the second omim
-            proteins_omim2 = mimtoprot[omim2]
-            #get the families
-            families_omim2 = set()
-            for protein in proteins_omim2:
-                families_omim2.update(pfamscan[protein])
-            #get the common families
-
-            common_families = set(families_omim1) & set(families_omim2)
-            #if the exclusion is empty, then we can add a one.
-            if common_families - exclusion:
-                f.write(str(omim1) + '\t' + str(omim2) + "\t1\n")
+    """
+    Writes the pairs of diseases sharing a (non excluded) pfam family, in
+    the order of the sorted disease pairs. The pairs are the nonzeros above
+    the diagonal of M.Mt, for the disease x family matrix M, computed a
+    block of rows at a time.
+    """
+    omims = sorted(mimtoprot.keys())
+    M = diseasePfamMatrix(pfamscan, mimtoprot, exclusion, omims)
+    Mt = M.T.tocsc()
+    with binary_format.open_output(outfile_name, binary_format.TRIPLETS) as f:
+        for start in range(0, len(omims), BLOCK_SIZE):
+            shared = (M[start:start + BLOCK_SIZE] @ Mt).tocsr()
+            shared.sort_indices()
+            for k in range(shared.shape[0]):
+                i = start + k
+                columns = shared.indices[shared.indptr[k]:shared.indptr[k + 1]]
+                columns = columns[columns > i]
+                if len(columns):
+                    omim1 = str(omims[i])
+                    f.write(''.join(omim1 + '\t' + str(omims[j]) + "\t1\n" for j in columns.tolist()))
 
 
 help_str = """
@@ -96,6 +109,7 @@ It takes two files as an input:
 The third parameter will be an output file 
 with the format 
          omim_i    omim_j    1.0
+(a binary triplet file if its name ends in .npd)
 
 if two diseases have proteins associated shared 
 at least one pfam family
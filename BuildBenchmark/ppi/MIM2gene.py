@@ -1,61 +1,63 @@
 #!/usr/bin/python
 
+import os
 import sys
+from array import array
 from collections import defaultdict
-from itertools import combinations
+import numpy as np
+import scipy.sparse
 from rich.progress import track
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Common'))
+import loaders
+import binary_format
 
+#diseases whose rows of the products are computed at once.
+BLOCK_SIZE = 2048
 
 #MIM:\bGENE_HUMAN\b(UniProt_id),\bGENENAME_HUMAN(UniProtId)...\n
 #only three genes in every line, and the line ends with a comma.
 def parse_mimtosp(filename, uniprotToGenename, valid_omim):
     mapping = defaultdict(list)
-    with open(filename,'r') as f:
-        mim = '' 
-        for line in f:
-            #get rid of the horrible spaces everywere
-            line = "".join(line.strip().split())
-            pieces = line.strip().split(':')
-            if len(pieces) ==  2:
-                mim = line.split(':')[0].strip()
-                genes = line.split(':')[1].strip()
-            else:
-                genes = line
-
-            for gene in genes.split(','):
-                if not gene:
-                    break
-
-                start = str(gene).index('(') + len('(')
-                end = str(gene).index(')', start)
-
-                if mim in valid_omim:
-                    mapping[mim].append(gene[start:end])
-                    mapping[mim].extend(uniprotToGenename[gene[start:end]])
+    mim = '' 
+    for line in loaders.read_lines(filename):
+        #get rid of the horrible spaces everywere
+        line = "".join(line.strip().split())
+        pieces = line.strip().split(':')
+        if len(pieces) ==  2:
+            mim = line.split(':')[0].strip()
+            genes = line.split(':')[1].strip()
+        else:
+            genes = line
+
+        for gene in genes.split(','):
+            if not gene:
+                break
+
+            start = str(gene).index('(') + len('(')
+            end = str(gene).index(')', start)
+
+            if mim in valid_omim:
+                mapping[mim].append(gene[start:end])
+                mapping[mim].extend(uniprotToGenename[gene[start:end]])
     return mapping
 
 
 def parse_validOmim(filename):
-    valid_omim = dict()
-    with open(filename,'r') as f:
-        for line in f:
-            valid_omim[line.strip()] = 1
-    return valid_omim
+    return dict.fromkeys(loaders.read_column(filename), 1)
 
 
 def parse_uniprotToGenename(filename):
     mapping = defaultdict(list)
-    with open(filename,'r') as f:
-        for line in f:
-            pieces = line.split('\t')
-            symbol = pieces[0].strip()
-            synonyms = pieces[1]
-            uniprot = pieces[2].strip()
-            if uniprot == '':
-                continue
-            mapping[uniprot].append(symbol)
-            if len(synonyms) > 0:
-               mapping[uniprot].extend([i.strip() for i in synonyms.split(',')])
+    for line in loaders.read_lines(filename):
+        pieces = line.split('\t')
+        symbol = pieces[0].strip()
+        synonyms = pieces[1]
+        uniprot = pieces[2].strip()
+        if uniprot == '':
+            continue
+        mapping[uniprot].append(symbol)
+        if len(synonyms) > 0:
+           mapping[uniprot].extend([i.strip() for i in synonyms.split(',')])
     return mapping
 
 #=========================================================================
@@ -109,45 +111,151 @@ class Interactions(object):
     def getInteractions(self):
         return self.__ppi
 
-#=========================================================================
 
+class PPINetwork(object):
+    """
+    Columnar alternative to Interactions: reads only the two interactor
+    gene symbol columns of the file, interns the symbols into integer
+    codes and keeps the network as a sparse symmetric adjacency matrix
+    (genes x genes), instead of an Interaction object per line.
+    It also behaves as the {gene: [interactors]} of getInteractions.
+    """
+    #columns of the interactor gene symbols in every layout.
+    __symbolColumns = {'columnsHPRD': (0, 3), 'columnsHINT': (2, 3)}
 
-def produce_benchmark(mimtosp, ppiNetwork, outfilename, useSharedProteins=True):
-    allPairs = combinations(mimtosp.keys(),2)
-    allPairslength = len(mimtosp.keys())
-    val = ((allPairslength)*(allPairslength-1))//2
-    with open(outfilename, 'w') as f:
-        leftValue = ''
-        rightValue = ''
-        for diseasePair in track(allPairs, total=val, description="Producing benchmark..."):
-            #just to make sure we allways write the smaller value to the left.
-            leftValue = min(diseasePair)
-            rightValue = max(diseasePair)
-            #the diseases share a protein. They need only to share a single protein
-            #for the pair to be excluded.
-            if len(set(mimtosp[leftValue]) & set(mimtosp[rightValue])):
-                #to avoid the cases where proteins are shared.
-                if  useSharedProteins:
-                    f.write(leftValue +"\t" + rightValue + "\t" + str(1) + "\n")
-                else:
+    def __init__(self, filename, fileDescription):
+        (first, second) = self.__symbolColumns[fileDescription]
+        self.index = dict()
+        interactors1 = array('i')
+        interactors2 = array('i')
+        with open(filename, 'r') as f:
+            for line in f:
+                pieces = line.strip().split('\t', second + 1)
+                if len(pieces) == 1 and not pieces[0]:
                     continue
-            #check the interactions
-            # we are looking for diseases whose proteins interact with one another.
-            else:
-                #fetch the interactors of the first disease
-                interactors = list()
-                for gene in mimtosp[diseasePair[1]]:
-                    interactors.extend(ppiNetwork[gene])
-                #check if they interact with one of the other proteins.
-                if set(interactors) & set(mimtosp[diseasePair[0]]):
-                    f.write(leftValue +"\t" + rightValue + "\t" + str(1) + "\n")
-                else: 
-                    #the reverse case.
-                    interactors = list()
-                    for gene in mimtosp[diseasePair[0]]:
-                        interactors.extend(ppiNetwork[gene])
-                    if set(interactors) & set(mimtosp[diseasePair[1]]):
-                        f.write(leftValue +"\t" + rightValue + "\t" + str(1) + "\n")
+                if len(pieces) <= second:
+                    print("Parse Error. Please check the file")
+                    exit()
+                interactors1.append(self.index.setdefault(pieces[first], len(self.index)))
+                interactors2.append(self.index.setdefault(pieces[second], len(self.index)))
+        self.genes = list(self.index)
+        rows = np.frombuffer(interactors1, dtype=np.int32)
+        cols = np.frombuffer(interactors2, dtype=np.int32)
+        n = len(self.genes)
+        self.adjacency = scipy.sparse.csr_matrix((np.ones(2 * len(rows), dtype=bool),
+                                                  (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+                                                 shape=(n, n))
+        self.adjacency.data[:] = 1
+
+    def __iter__(self):
+        return iter(self.genes)
+
+    def __getitem__(self, gene):
+        if gene not in self.index:
+            return []
+        i = self.index[gene]
+        adjacency = self.adjacency
+        return [self.genes[j] for j in adjacency.indices[adjacency.indptr[i]:adjacency.indptr[i + 1]]]
+
+    def getInteractions(self):
+        return self
+
+#=========================================================================
+
+
+def gene_index(mimtosp, ppiNetwork):
+    """Column of every gene (uniprot id or symbol) of the diseases and of the network."""
+    index = dict()
+    for genes in mimtosp.values():
+        for gene in genes:
+            index.setdefault(gene, len(index))
+    for gene in ppiNetwork:
+        index.setdefault(gene, len(index))
+        for interactor in ppiNetwork[gene]:
+            index.setdefault(interactor, len(index))
+    return index
+
+
+def disease_gene_matrix(mimtosp, omims, index):
+    """Sparse diseases x genes incidence matrix M, rows in the order of `omims`."""
+    rows = []
+    cols = []
+    for i, omim in enumerate(omims):
+        for gene in mimtosp[omim]:
+            rows.append(i)
+            cols.append(index[gene])
+    M = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(omims), len(index)))
+    M.data[:] = 1
+    return M
+
+
+def adjacency_matrix(ppiNetwork, index):
+    """Sparse genes x genes adjacency A of the network, {gene: [interactors]}."""
+    rows = []
+    cols = []
+    for gene in ppiNetwork:
+        for interactor in ppiNetwork[gene]:
+            rows.append(index[gene])
+            cols.append(index[interactor])
+    A = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(index), len(index)))
+    A.data[:] = 1
+    return A
+
+
+def network_matrices(mimtosp, ppiNetwork):
+    """Gene index and adjacency matrix of a PPINetwork or a {gene: [interactors]} network."""
+    if not isinstance(ppiNetwork, PPINetwork):
+        index = gene_index(mimtosp, ppiNetwork)
+        return index, adjacency_matrix(ppiNetwork, index)
+    #the genes of the diseases go after the ones of the network.
+    index = dict(ppiNetwork.index)
+    for genes in mimtosp.values():
+        for gene in genes:
+            index.setdefault(gene, len(index))
+    A = ppiNetwork.adjacency.copy()
+    A.resize((len(index), len(index)))
+    return index, A
+
+
+def neighbourhood(M, A, hops):
+    """Genes of every disease (rows of M) and the genes within `hops` interactions of them."""
+    reach = M
+    for _ in range(hops):
+        reach = reach + reach @ A
+        reach.data[:] = 1
+    return reach
+
+
+def produce_benchmark(mimtosp, ppiNetwork, outfilename, useSharedProteins=True, hops=1):
+    """
+    Writes the pairs of diseases with interacting proteins (omim_i < omim_j,
+    sorted). With the diseases x genes matrix M and the adjacency A of the
+    network, the pairs sharing a protein are the nonzeros of M.Mt and the
+    pairs with interacting proteins those of M.(I + A)^hops.Mt; hops > 1
+    also links the diseases whose proteins are that many interactions apart.
+    The pairs sharing a protein are written only if useSharedProteins.
+    """
+    omims = sorted(mimtosp.keys())
+    (index, A) = network_matrices(mimtosp, ppiNetwork)
+    M = disease_gene_matrix(mimtosp, omims, index)
+    Mt = M.T.tocsc()
+    with binary_format.open_output(outfilename, binary_format.TRIPLETS) as f:
+        for start in track(range(0, len(omims), BLOCK_SIZE), description="Producing benchmark..."):
+            block = M[start:start + BLOCK_SIZE]
+            linked = (neighbourhood(block, A, hops) @ Mt).tocsr()
+            if not useSharedProteins:
+                #the shared pairs are a subset of the linked ones.
+                shared = block @ Mt
+                shared.data[:] = 1
+                linked.data[:] = 1
+                linked = (linked - shared).tocsr()
+                linked.eliminate_zeros()
+            linked.sort_indices()
+            for k in range(linked.shape[0]):
+                i = start + k
+                columns = linked.indices[linked.indptr[k]:linked.indptr[k + 1]]
+                columns = columns[columns > i]
+                f.write(''.join(omims[i] + "\t" + omims[j] + "\t" + str(1) + "\n" for j in columns.tolist()))
 
 help_string = """
 --------------------------------------------------------------------------------------------------------------
@@ -159,24 +267,30 @@ Input:
         Produces PPIN
         Usage:
         ======
-        python MIM2gene.py uniprot_to_genename mim2sp ppi_file phenotypes outfile
+        python MIM2gene.py uniprot_to_genename mim2sp ppi_file phenotypes outfile [--hops N]
         Where:
         \t*HGNC name to UniProt mapping file.
         \t*mimtosp file (http://www.uniprot.org/docs/mimtosp.txt)
         \t*protein-protein interaction file
         \t*valid_omim file of accepted omim numbers, e.g. phenotype list file.
-        \t*output_file_name: A path for the output file.
+        \t*output_file_name: A path for the output file (a binary triplet file if it ends in .npd).
+        \t*--hops N: also link diseases whose proteins are up to N interactions apart (default: 1).
 --------------------------------------------------------------------------------------------------------------
 """
 
 if __name__ == "__main__":
 
-    if len(sys.argv) < 4:
+    hops = 1
+    if '--hops' in sys.argv:
+        position = sys.argv.index('--hops')
+        hops = int(sys.argv[position + 1])
+        del sys.argv[position:position + 2]
+    if len(sys.argv) < 6:
         print(help_string)
         exit()
     uniprotToGenename = parse_uniprotToGenename(sys.argv[1])
     valid_omim = parse_validOmim(sys.argv[4])
     mimtosp = parse_mimtosp(sys.argv[2],uniprotToGenename,valid_omim)
-    hprd = Interactions(sys.argv[3], 'columnsHPRD')
+    hprd = PPINetwork(sys.argv[3], 'columnsHPRD')
     #produce benchmark
-    produce_benchmark(mimtosp, hprd.getInteractions(), sys.argv[5], False)
+    produce_benchmark(mimtosp, hprd.getInteractions(), sys.argv[5], False, hops)
@@ -0,0 +1,396 @@
+"""
+    Memory-mappable binary form of the mapping and triplet files
+    Copyright (C) 2015 Horacio Caniza
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+__author__  = "Horacio Caniza"
+__email__   = "h.j.canizavierci@cs.rhul.ac.uk"
+__copyright__ = "Copyright (C) 2015 Horacio Caniza"
+__license__ = "GPL"
+__version__ = "3"
+
+"""
+Binary alternative to the tab separated files of the pipeline. A binary
+file is a directory (named *.npd) of .npy arrays and a meta.json:
+
+    mapping (mim2pubmed, pubmed2mesh, mim2mesh), a row per line of the TSV:
+        keys.npy      first field of every row
+        labels.npy    distinct values; the values are int32 codes into them
+        indptr.npy    int64, the values of row i are indices[indptr[i]:indptr[i + 1]]
+        indices.npy   int32
+        weights.npy   int32, only for weighted files (descriptor:count)
+
+    triplets (ID_1 ID_2 VALUE, the similarity and ground truth files):
+        ids.npy       the identifiers; the pairs are int32 codes into them
+        pairs.npy     uint64, (code of ID_1 << 32) | code of ID_2
+        values.npy    float32
+
+The arrays are memory-mapped when read, so the consumers do not parse
+anything but the labels. The rows and pairs keep the order of the TSV, and
+export writes the same lines back (the values of the triplets as float32).
+
+The readers of Common/loaders.py accept either form; the writers produce
+the binary form when the output name ends in .npd, or, for the similarity
+files, when $DISSIM_FORMAT is 'binary'.
+
+    python binary_format.py import mapping mim2mesh.txt mim2mesh.npd
+    python binary_format.py export mim2mesh.npd mim2mesh.txt
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+from array import array
+from contextlib import contextmanager
+import numpy as np
+
+SUFFIX = '.npd'
+META = 'meta.json'
+VERSION = 1
+MAPPING = 'mapping'
+TRIPLETS = 'triplets'
+#environment variable selecting the format of the similarity files ('tsv' or 'binary').
+ENVIRONMENT = 'DISSIM_FORMAT'
+MAX_CODE = np.iinfo(np.int32).max
+#lines of a TSV parsed at once by the importers.
+READ_CHUNK = 8 * 1024 * 1024
+
+
+def is_binary(filename):
+    """True if `filename` is a binary mapping or triplet file."""
+    return os.path.isfile(os.path.join(filename, META))
+
+
+def wants_binary(filename):
+    """True if an output named `filename` should be written in binary form."""
+    return filename.endswith(SUFFIX)
+
+
+def output_suffix():
+    """SUFFIX if $DISSIM_FORMAT asks for binary outputs, '' otherwise."""
+    return SUFFIX if os.environ.get(ENVIRONMENT, '').lower() == 'binary' else ''
+
+
+def size(filename):
+    """Size in bytes of a file, or of the arrays of a binary file."""
+    if os.path.isdir(filename):
+        return sum(os.path.getsize(os.path.join(filename, f)) for f in os.listdir(filename))
+    return os.path.getsize(filename)
+
+
+def read_meta(filename, kind=None):
+    with open(os.path.join(filename, META), 'r') as f:
+        meta = json.load(f)
+    if meta.get('version') != VERSION:
+        raise ValueError(filename + ': unsupported version ' + str(meta.get('version')))
+    if kind is not None and meta.get('format') != kind:
+        raise ValueError(filename + ' is a ' + str(meta.get('format')) + ' file, not ' + kind)
+    return meta
+
+
+def save(filename, kind, arrays, **meta):
+    """Writes the arrays and meta.json of a binary file; the directory is replaced at once."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(filename) + '.', dir=directory)
+    try:
+        for name, values in arrays.items():
+            np.save(os.path.join(tmp_dir, name + '.npy'), values, allow_pickle=False)
+        meta.update(format=kind, version=VERSION)
+        with open(os.path.join(tmp_dir, META), 'w') as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+        if os.path.isdir(filename):
+            shutil.rmtree(filename)
+        elif os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmp_dir, filename)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load(filename, name, use_mmap=True):
+    return np.load(os.path.join(filename, name + '.npy'), mmap_mode='r' if use_mmap else None, allow_pickle=False)
+
+
+def labels_array(labels):
+    return np.array(labels, dtype=str) if len(labels) else np.zeros(0, dtype='<U1')
+
+
+class Mapping(object):
+    """
+    A binary mapping file, memory-mapped: the keys and labels are lists,
+    indptr, indices and weights (None if not weighted) arrays.
+    """
+    def __init__(self, filename, use_mmap=True):
+        self.filename = filename
+        self.meta = read_meta(filename, MAPPING)
+        self.keys = load(filename, 'keys', False).tolist()
+        self.labels = load(filename, 'labels', False).tolist()
+        self.indptr = load(filename, 'indptr', use_mmap)
+        self.indices = load(filename, 'indices', use_mmap)
+        self.weights = load(filename, 'weights', use_mmap) if self.meta.get('weighted') else None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def pairs(self):
+        """(key, value) columns of every value of every row, as lists of strings."""
+        lengths = np.diff(self.indptr)
+        keys = np.repeat(np.array(self.keys, dtype=object), lengths).tolist()
+        labels = np.array(self.labels, dtype=object)
+        return keys, labels[self.indices].tolist()
+
+    def rows(self):
+        """Yields the (key, [fields]) of every row, the fields as in the TSV (descriptor:count if weighted)."""
+        labels = self.labels
+        indptr = self.indptr.tolist()
+        #plain views of the maps, cheaper to slice.
+        indices = np.asarray(self.indices)
+        weights = None if self.weights is None else np.asarray(self.weights)
+        for i, key in enumerate(self.keys):
+            (start, end) = (indptr[i], indptr[i + 1])
+            values = [labels[j] for j in indices[start:end].tolist()]
+            if weights is not None:
+                values = [v + ':' + str(w) for (v, w) in zip(values, weights[start:end].tolist())]
+            yield key, values
+
+
+class MappingWriter(object):
+    """
+    Writes a binary mapping a row at a time:
+
+        writer = MappingWriter('mim2mesh.npd', weighted=True)
+        writer.add('100100', ['D000001', 'D000002'], [3, 1])
+        writer.close()
+    """
+    def __init__(self, filename, weighted=False):
+        self.filename = filename
+        self.weighted = weighted
+        self.keys = []
+        self.index = dict()
+        self.indptr = array('q', [0])
+        self.indices = array('i')
+        self.weights = array('i')
+
+    def add(self, key, values, weights=None):
+        index = self.index
+        for value in values:
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(index)
+                if code > MAX_CODE:
+                    raise OverflowError(self.filename + ': more than 2^31 distinct values')
+            self.indices.append(code)
+        if self.weighted:
+            self.weights.extend(weights)
+            if len(self.weights) != len(self.indices):
+                raise ValueError(self.filename + ': ' + key + ' has a different number of values and weights')
+        self.keys.append(key)
+        self.indptr.append(len(self.indices))
+
+    def close(self):
+        indices = np.frombuffer(self.indices, dtype=np.int32) if len(self.indices) else np.zeros(0, dtype=np.int32)
+        arrays = {'keys': labels_array(self.keys), 'labels': labels_array(list(self.index)),
+                  'indptr': np.frombuffer(self.indptr, dtype=np.int64), 'indices': indices}
+        if self.weighted:
+            arrays['weights'] = np.frombuffer(self.weights, dtype=np.int32) if len(self.weights) else np.zeros(0, dtype=np.int32)
+        save(self.filename, MAPPING, arrays, weighted=self.weighted)
+
+
+class Triplets(object):
+    """A binary triplet file, memory-mapped: ids (list), pairs (uint64) and values (float32)."""
+    def __init__(self, filename, use_mmap=True):
+        self.filename = filename
+        self.meta = read_meta(filename, TRIPLETS)
+        self.ids = load(filename, 'ids', False).tolist()
+        self.pairs = load(filename, 'pairs', use_mmap)
+        self.values = load(filename, 'values', use_mmap)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def codes(self):
+        """(codes of ID_1, codes of ID_2) of every triplet, int64."""
+        pairs = np.asarray(self.pairs)
+        return (pairs >> np.uint64(32)).astype(np.int64), (pairs & np.uint64(0xffffffff)).astype(np.int64)
+
+
+class TripletWriter(object):
+    """
+    Writes a binary triplet file a block at a time; `ids` are the
+    identifiers the codes of the blocks refer to (e.g. sem_sim.objects).
+    """
+    def __init__(self, filename, ids):
+        self.filename = filename
+        self.ids = list(ids)
+        if len(self.ids) > MAX_CODE:
+            raise OverflowError(filename + ': more than 2^31 identifiers')
+        self.pairs = []
+        self.values = []
+
+    def add(self, first, second, values):
+        first = np.asarray(first, dtype=np.uint64)
+        second = np.asarray(second, dtype=np.uint64)
+        self.pairs.append((first << np.uint64(32)) | second)
+        self.values.append(np.asarray(values, dtype=np.float32))
+
+    def close(self):
+        pairs = np.concatenate(self.pairs) if self.pairs else np.zeros(0, dtype=np.uint64)
+        values = np.concatenate(self.values) if self.values else np.zeros(0, dtype=np.float32)
+        save(self.filename, TRIPLETS, {'ids': labels_array(self.ids), 'pairs': pairs, 'values': values})
+
+
+def split_weight(field):
+    """descriptor:count -> (descriptor, count)"""
+    (value, _, count) = field.rpartition(':')
+    return value, int(count)
+
+
+def is_weighted(fields):
+    return bool(fields) and all(':' in f and f.rpartition(':')[2].isdigit() for f in fields)
+
+
+def import_mapping(tsv_file, filename, weighted=None):
+    """
+    Converts a TSV mapping (key value ... value) into a binary mapping.
+    weighted (descriptor:count fields) is detected from the first row with
+    values if None.
+    """
+    #loaders imports this module, so it is imported here.
+    import loaders
+    writer = None
+    pending = []
+    for (key, values) in loaders.read_rows(tsv_file):
+        if writer is None:
+            if weighted is None and not values:
+                pending.append(key)
+                continue
+            if weighted is None:
+                weighted = is_weighted(values)
+            writer = MappingWriter(filename, weighted)
+            for k in pending:
+                writer.add(k, [], [])
+        if weighted:
+            values = [split_weight(v) for v in values]
+            writer.add(key, [v for (v, _) in values], [w for (_, w) in values])
+        else:
+            writer.add(key, values)
+    if writer is None:
+        writer = MappingWriter(filename, bool(weighted))
+        for k in pending:
+            writer.add(k, [], [])
+    writer.close()
+
+
+def export_mapping(filename, tsv_file):
+    with open(tsv_file, 'w') as out:
+        for (key, values) in Mapping(filename).rows():
+            out.write(key + ''.join('\t' + v for v in values) + '\n')
+
+
+def import_triplets(tsv_file, filename):
+    """Converts a TSV triplet file (ID_1 ID_2 VALUE) into a binary one; the ids are coded in order of appearance."""
+    index = dict()
+    blocks = []
+    with open(tsv_file, 'r') as f:
+        while True:
+            lines = f.readlines(READ_CHUNK)
+            if not lines:
+                break
+            tokens = ''.join(lines).split()
+            if len(tokens) % 3:
+                raise ValueError(tsv_file + ': lines without three fields')
+            first = [index.setdefault(i, len(index)) for i in tokens[0::3]]
+            second = [index.setdefault(i, len(index)) for i in tokens[1::3]]
+            blocks.append((first, second, np.array(tokens[2::3], dtype=np.float32)))
+    writer = TripletWriter(filename, index)
+    for block in blocks:
+        writer.add(*block)
+    writer.close()
+
+
+def export_triplets(filename, tsv_file):
+    triplets = Triplets(filename)
+    ids = np.array(triplets.ids, dtype=object)
+    (first, second) = triplets.codes()
+    with open(tsv_file, 'w') as out:
+        for start in range(0, len(first), 1 << 16):
+            end = start + (1 << 16)
+            rows = zip(ids[first[start:end]].tolist(), ids[second[start:end]].tolist(),
+                       triplets.values[start:end].tolist())
+            out.write(''.join('%s\t%s\t%.7g\n' % row for row in rows))
+
+
+@contextmanager
+def open_output(filename, kind=MAPPING, weighted=None):
+    """
+    Text file for a writer producing a TSV mapping (or triplets) a line at
+    a time. If `filename` is binary (.npd), the lines go to a temporary TSV
+    that is imported when the writer is done.
+    """
+    if not wants_binary(filename):
+        with open(filename, 'w') as f:
+            yield f
+        return
+    tsv_file = filename + '.tsv.tmp'
+    try:
+        with open(tsv_file, 'w') as f:
+            yield f
+        if kind == TRIPLETS:
+            import_triplets(tsv_file, filename)
+        else:
+            import_mapping(tsv_file, filename, weighted)
+    finally:
+        if os.path.exists(tsv_file):
+            os.remove(tsv_file)
+
+
+help_string = """
+        Use: python binary_format.py import mapping|triplets file.tsv file.npd
+             python binary_format.py export file.npd file.tsv
+             python binary_format.py info file.npd
+            import: converts a TSV mapping (key value ... value, or descriptor:count values)
+                    or triplet file (ID_1 ID_2 VALUE) into the binary form.
+            export: writes the TSV of a binary file.
+    """
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'import' and len(sys.argv) == 5 and sys.argv[2] in (MAPPING, TRIPLETS):
+        if sys.argv[2] == MAPPING:
+            import_mapping(sys.argv[3], sys.argv[4])
+        else:
+            import_triplets(sys.argv[3], sys.argv[4])
+    elif command == 'export' and len(sys.argv) == 4:
+        if read_meta(sys.argv[2])['format'] == MAPPING:
+            export_mapping(sys.argv[2], sys.argv[3])
+        else:
+            export_triplets(sys.argv[2], sys.argv[3])
+    elif command == 'info' and len(sys.argv) == 3:
+        meta = read_meta(sys.argv[2])
+        if meta['format'] == MAPPING:
+            mapping = Mapping(sys.argv[2])
+            print('mapping: %d rows, %d values, %d distinct' % (len(mapping), len(mapping.indices), len(mapping.labels)))
+        else:
+            triplets = Triplets(sys.argv[2])
+            print('triplets: %d pairs, %d ids' % (len(triplets), len(triplets.ids)))
+        print(json.dumps(meta, sort_keys=True))
+    else:
+        print(help_string)
+        sys.exit(-1)
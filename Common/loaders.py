@@ -0,0 +1,244 @@
+"""
+    Readers of the mapping files shared by the scripts
+    Copyright (C) 2015 Horacio Caniza
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+__author__  = "Horacio Caniza"
+__email__   = "h.j.canizavierci@cs.rhul.ac.uk"
+__copyright__ = "Copyright (C) 2015 Horacio Caniza"
+__license__ = "GPL"
+__version__ = "3"
+
+"""
+Bulk readers of the tab/space separated files of the pipeline (mim2mesh,
+pubmed2mesh, mimtoprot, pfam_scan outputs, id lists...). A file is read
+whole (or memory-mapped, with use_mmap) and split at once instead of line
+by line.
+
+The scripts import this module through a path shim:
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+    import loaders
+
+Mappings are returned as dicts ({key: list or set of values}) or, with
+EncodedMapping, as integer codes in CSR form, from which the sparse
+engines (e.g. filterBenchmarks) build their incidence matrices without
+going through a dict.
+
+The mapping readers also accept the binary mappings of binary_format.py
+(*.npd), read as the TSV they were imported from.
+"""
+
+import mmap
+from collections import defaultdict
+import numpy as np
+import scipy.sparse
+
+import binary_format
+
+
+def read_text(filename, use_mmap=False):
+    """Contents of a text file, read at once (through a memory map if use_mmap)."""
+    if not use_mmap:
+        with open(filename, 'r') as f:
+            return f.read()
+    with open(filename, 'rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return m[:].decode()
+        except ValueError:
+            #empty files cannot be mapped.
+            return ''
+
+
+def read_lines(filename, use_mmap=False):
+    return read_text(filename, use_mmap).splitlines()
+
+
+def encode(strings, sort=True):
+    """(distinct strings, sorted unless not sort; int32 code of every string)."""
+    labels = list(dict.fromkeys(strings))
+    if sort:
+        labels.sort()
+    index = dict(zip(labels, range(len(labels))))
+    return labels, np.fromiter(map(index.__getitem__, strings), dtype=np.int32, count=len(strings))
+
+
+def strip_weight(field):
+    """descriptor:count (MIM2MESH.py --weights) -> descriptor"""
+    return field.split(':')[0]
+
+
+def read_column(filename, convert=None, use_mmap=False):
+    """Set of the first field of every line (e.g. lists of ids), converted with `convert` if given."""
+    if binary_format.is_binary(filename):
+        values = binary_format.Mapping(filename).keys
+    else:
+        values = (line.split(None, 1)[0] for line in read_lines(filename, use_mmap) if line.strip())
+    if convert is not None:
+        return set(map(convert, values))
+    return set(values)
+
+
+def read_rows(filename, separator=None, use_mmap=False):
+    """Yields the (key, [fields]) of every non empty line."""
+    if binary_format.is_binary(filename):
+        yield from binary_format.Mapping(filename).rows()
+        return
+    for line in read_lines(filename, use_mmap):
+        fields = line.strip().split(separator) if separator else line.split()
+        if fields and fields[0]:
+            yield fields[0], fields[1:]
+
+
+def read_mapping(filename, container=list, strip_weights=False, accumulate=False, separator=None, use_mmap=False):
+    """
+    {key: container of the other fields of its line} of a file
+
+        key value value ... value
+
+    If a key is repeated, the last line is kept, or, with accumulate, the
+    values of all the lines are joined. strip_weights drops the counts of
+    weighted files (descriptor:count).
+    """
+    mapping = defaultdict(container)
+    for (key, values) in read_rows(filename, separator, use_mmap):
+        if strip_weights:
+            values = [strip_weight(v) for v in values]
+        if not accumulate:
+            mapping[key] = values if container is list else container(values)
+        elif container is set:
+            mapping[key].update(values)
+        else:
+            mapping[key].extend(values)
+    return mapping
+
+
+def read_dict(filename, separator='\t', use_mmap=False):
+    """{key: value} of a two column file (names may contain spaces, so the separator is a tab)."""
+    mapping = defaultdict()
+    for (key, values) in read_rows(filename, separator, use_mmap):
+        mapping[key] = values[0]
+    return mapping
+
+
+def read_pairs(filename, use_mmap=False):
+    """
+    The two columns of a file of pairs (key value, one per line) as lists
+    of strings; a binary mapping gives a pair per value of every row.
+    """
+    if binary_format.is_binary(filename):
+        return binary_format.Mapping(filename).pairs()
+    text = read_text(filename, use_mmap)
+    tokens = text.split()
+    lines = text.count('\n') + (1 if text and not text.endswith('\n') else 0)
+    if len(tokens) != 2 * lines:
+        #empty lines, or lines with more or less than two fields: split line by line.
+        tokens = []
+        for line in text.splitlines():
+            fields = line.split()
+            if fields:
+                (key, value) = fields
+                tokens.extend((key, value))
+    return tokens[0::2], tokens[1::2]
+
+
+def read_pairs_mapping(filename, container=set, use_mmap=False):
+    """{key: container of its values} of a file of pairs (e.g. omim uniprot, one per line)."""
+    (keys, values) = read_pairs(filename, use_mmap)
+    mapping = defaultdict(container)
+    add = container.add if container is set else container.append
+    for (k, v) in zip(keys, values):
+        add(mapping[k], v)
+    return mapping
+
+
+def read_pfam_scan(filename, use_mmap=False):
+    """
+    (proteins, families) of the hits of a pfam_scan output, one per line:
+    the UniProt id (sp|P12345|NAME) and the pfam family (column 7,
+    upper case). Comments (#) and empty lines are skipped.
+    """
+    proteins = []
+    families = []
+    for line in read_lines(filename, use_mmap):
+        if not line or line[0] == '#':
+            continue
+        fields = line.split(None, 7)
+        if len(fields) < 7:
+            continue
+        proteins.append(fields[0].split('|')[1])
+        families.append(fields[6].upper())
+    return proteins, families
+
+
+class EncodedMapping(object):
+    """
+    A mapping {key: values} as integer codes: the keys are rows, the
+    distinct values columns, and the values of row i are
+    values[indices[indptr[i]:indptr[i + 1]]] (CSR).
+    """
+    def __init__(self, keys, values, indptr, indices):
+        self.keys = list(keys)
+        self.values = list(values)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+
+    @classmethod
+    def from_pairs(cls, keys, values):
+        """From the columns of a file of pairs, keys and values sorted; repeated pairs are kept once."""
+        (key_labels, rows) = encode(keys)
+        (value_labels, cols) = encode(values)
+        M = scipy.sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                                    shape=(len(key_labels), len(value_labels)))
+        M.sum_duplicates()
+        return cls(key_labels, value_labels, M.indptr, M.indices)
+
+    @classmethod
+    def from_mapping(cls, mapping, keys=None):
+        """From {key: values}, with the rows in the order of `keys` (default: sorted)."""
+        keys = sorted(mapping) if keys is None else list(keys)
+        columns = dict()
+        indptr = [0]
+        indices = []
+        for key in keys:
+            codes = set(columns.setdefault(v, len(columns)) for v in mapping.get(key, ()))
+            indices.extend(sorted(codes))
+            indptr.append(len(indices))
+        return cls(keys, list(columns), indptr, indices)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def matrix(self, dtype=np.float64):
+        """Sparse keys x values incidence matrix."""
+        data = np.ones(len(self.indices), dtype=dtype)
+        return scipy.sparse.csr_matrix((data, self.indices, self.indptr), shape=(len(self.keys), len(self.values)))
+
+    def to_mapping(self, container=set):
+        mapping = defaultdict(container)
+        for i, key in enumerate(self.keys):
+            mapping[key] = container(self.values[j] for j in self[i])
+        return mapping
+
+
+def read_encoded_pairs(filename, use_mmap=False):
+    """EncodedMapping of a file of pairs (key value, one per line), keys and values sorted."""
+    return EncodedMapping.from_pairs(*read_pairs(filename, use_mmap))
@@ -23,8 +23,12 @@ __copyright__ = "Copyright (C) 2015 Horacio Caniza"
 __license__ = "GPL"
 __version__ = "3"
 
+import os
+import sys
 from collections import defaultdict
 from thesaurus import *
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import loaders
 
 
 class Annotation(object):
@@ -93,6 +97,8 @@ class AnnotationParser(object):
 
     the file is the file formed by:
         OMIM\tMESH_1\tMESH_2..MESH_K.
+    Weighted files (MESH_1:COUNT, see MIM2MESH.py --weights) are accepted,
+    the counts are ignored.
     
     """
     def __init__(self, thesaurus, datafile):
@@ -102,10 +108,7 @@ class AnnotationParser(object):
         self.__readAnnotations(datafile)
 
     def __readAnnotations(self, datafile):
-        with open(datafile) as f:
-            for line in f:
-                fields = line.strip().split()
-                self.__data[fields[0]] = fields[1:]
+        self.__data.update(loaders.read_mapping(datafile, list, strip_weights=True))
 
 
     def get_annotations(self, chosen_categories=[]):
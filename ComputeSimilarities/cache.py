@@ -0,0 +1,137 @@
+"""
+    Computes semantic similarity in the MeSH ontologies.
+    Copyright (C) 2015 Horacio Caniza
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+__author__  = "Horacio Caniza"
+__email__   = "h.j.canizavierci@cs.rhul.ac.uk"
+__copyright__ = "Copyright (C) 2015 Horacio Caniza"
+__license__ = "GPL"
+__version__ = "3"
+
+"""
+Matrix caches. Legacy caches (.txt) are dense text matrices; the others are
+.npy files, memory-mapped when read, holding either the dense matrix or the
+packed upper triangle of a SymmetricMatrix, with a JSON sidecar
+(cache + '.json') describing the storage and the normalisation applied to
+the values (see SemanticSimilarity.normalise), if any:
+
+    {"storage": "dense" | "packed", "dtype": "float64", "n": 1234,
+     "layout": 2, "normalisation": {...}}
+
+Text caches get the sidecar as well. "layout" is the order of the rows:
+caches without it (or with another one) predate the sorted descriptors and
+are stale, see is_current. Caches are never modified in place: a stale one
+is recomputed, written to cache + '.part' and renamed, and its sidecar is
+written last, so an interrupted run leaves a stale cache, not a wrong one.
+"""
+
+import os
+import json
+import numpy as np
+from storage import SymmetricMatrix
+
+#suffix of a cache being written, renamed once complete.
+PARTIAL = '.part'
+METADATA = '.json'
+#order of the rows of the caches: 2, descriptors sorted (before, in set order).
+LAYOUT = 2
+
+
+def read_metadata(filename):
+    """Sidecar metadata of a cache, {} if there is none (legacy caches)."""
+    if not os.path.isfile(filename + METADATA):
+        return dict()
+    with open(filename + METADATA) as f:
+        return json.load(f)
+
+
+def is_current(filename):
+    """True if the cache `filename` exists and has the current layout, i.e. can be loaded."""
+    return os.path.isfile(filename) and read_metadata(filename).get('layout') == LAYOUT
+
+
+def discard_metadata(filename):
+    """Removes the metadata of a cache about to be replaced, so it is stale until the new one is complete."""
+    if os.path.isfile(filename + METADATA):
+        os.remove(filename + METADATA)
+
+
+def write_metadata(filename, matrix, **metadata):
+    """Writes the sidecar metadata of the cache `filename`."""
+    packed = isinstance(matrix, SymmetricMatrix)
+    values = {'storage': 'packed' if packed else 'dense',
+              'dtype': np.dtype(matrix.dtype).name,
+              'n': int(matrix.shape[0]),
+              'layout': LAYOUT}
+    values.update(metadata)
+    with open(filename + METADATA + PARTIAL, 'w') as f:
+        json.dump(values, f, indent=1, sort_keys=True)
+    os.replace(filename + METADATA + PARTIAL, filename + METADATA)
+
+
+def create_matrix(filename, n, packed=False, dtype=np.float64):
+    """
+    Creates a writable memory-mapped n x n matrix for the cache `filename`.
+    It is written to a temporary file until commit_matrix is called, so an
+    interrupted run never leaves a truncated cache behind.
+    """
+    if packed:
+        data = np.lib.format.open_memmap(filename + PARTIAL, mode='w+', dtype=dtype, shape=(n * (n + 1) // 2,))
+        return SymmetricMatrix(n, data=data)
+    return np.lib.format.open_memmap(filename + PARTIAL, mode='w+', dtype=dtype, shape=(n, n))
+
+
+def commit_matrix(matrix, filename, **metadata):
+    """Flushes a matrix created by create_matrix and makes it the cache `filename`."""
+    data = matrix.data if isinstance(matrix, SymmetricMatrix) else matrix
+    data.flush()
+    discard_metadata(filename)
+    os.replace(filename + PARTIAL, filename)
+    write_metadata(filename, matrix, **metadata)
+
+
+def save_matrix(filename, matrix, **metadata):
+    """
+    Writes the cache `filename`, as text for .txt caches, as .npy otherwise.
+    The metadata is written last: an interrupted write leaves a stale cache.
+    """
+    if filename.endswith('.txt'):
+        if isinstance(matrix, SymmetricMatrix):
+            matrix = matrix.toarray()
+        with open(filename + PARTIAL, 'wb') as f:
+            np.savetxt(f, matrix, delimiter='\t', newline='\n')
+    else:
+        data = matrix.data if isinstance(matrix, SymmetricMatrix) else matrix
+        with open(filename + PARTIAL, 'wb') as f:
+            np.save(f, data)
+    discard_metadata(filename)
+    os.replace(filename + PARTIAL, filename)
+    write_metadata(filename, matrix, **metadata)
+
+
+def load_matrix(filename, mode='r'):
+    """
+    Reads the cache `filename`: .txt caches in memory, .npy caches as a
+    memory map (read only unless mode is 'r+'), packed ones as a SymmetricMatrix.
+    """
+    if filename.endswith('.txt'):
+        return np.loadtxt(filename, delimiter='\t')
+    data = np.load(filename, mmap_mode=mode)
+    if read_metadata(filename).get('storage') == 'packed':
+        return SymmetricMatrix(read_metadata(filename)['n'], data=data)
+    return data
@@ -28,7 +28,7 @@ help_string = """
     --------------------------------------------------------------------------------------------------------------
     Usage:
     =====
-    python compute_combined_similarity.py descriptors_file annotation_file chosen_measure ism category_subset [all/two/five] Optional:filename_modifier
+    python compute_combined_similarity.py descriptors_file annotation_file chosen_measure ism category_subset [all/two/five] Optional:filename_modifier [--tile-size N] [--packed] [--float32]
 
     *Small format guide:
 
@@ -70,6 +70,15 @@ help_string = """
         filename_modifier:
                 Appends a string modifier to the filename, for flexilibity mainly. If nothing is set, that's ok.
 
+        --packed, --float32:
+                Store the similarity matrices (per descriptor, per disease, and those of the ISM) as
+                their upper triangle only and/or in single precision, which together quarter the
+                memory. The caches are then written as .npy files with a .json metadata file.
+
+        --tile-size N:
+                Tiled (out-of-core) mode, see compute_matrices.py. The LCA and the ISM are not written
+                in this mode.
+
     --------------------------------------------------------------------------------------------------------------
 
 """
@@ -83,6 +92,7 @@ from annotation import *
 from semsim import *
 from similarity_measures import *
 from writeFiles import *
+from cache import *
 
 #CATEGORIES
 categories = {
@@ -99,6 +109,19 @@ names_diseasewise = {"SIMUI":0, "SIMGIC":1}
 
 
 
+tile_size = 0
+if '--tile-size' in sys.argv:
+    position = sys.argv.index('--tile-size')
+    tile_size = int(sys.argv[position + 1])
+    del sys.argv[position:position + 2]
+
+#storage of the matrices (see SemanticSimilarity.set_storage); the caches are .npy files then.
+packed = '--packed' in sys.argv
+float32 = '--float32' in sys.argv
+sys.argv = [arg for arg in sys.argv if arg not in ('--packed', '--float32')]
+SemanticSimilarity.set_storage(packed, np.float32 if float32 else np.float64)
+cache_ext = '.npy' if packed or float32 else '.txt'
+
 if len(sys.argv) < 5:
     print(help_string)
     sys.exit(-1)
@@ -124,6 +147,31 @@ annotation_parser = AnnotationParser(thesaurus, annotation_file)
 annotation = annotation_parser.get_annotations()
 
 print("\t- Computing " + chosen_measure)
+if tile_size:
+    if chosen_measure in names_termwise:
+        method_pair = methods_termwise[names_termwise[chosen_measure]]
+        sem_sim = method_pair[0](thesaurus, annotation,method_pair[1])
+        cache_file = './Cache/combined_' + chosen_measure + '_' + str(categories_subset) +"_per_descriptor.npy"
+        if is_current(cache_file):
+            sem_sim.load_per_descriptor(cache_file)
+        else:
+            print('\t\t- Computing per descriptor..')
+            out = create_matrix(cache_file, sem_sim.num_descriptors, sem_sim.packed, sem_sim.dtype)
+            sem_sim.compute_semantic_similarity_per_descriptor_tiled(InformationContent(thesaurus, annotation, sem_sim.descriptors), out, tile_size)
+            commit_matrix(out, cache_file, normalisation=sem_sim.scaling)
+            sem_sim.perDescriptor = load_matrix(cache_file)
+        print('\t\t- Computing per object..')
+        tiles = iter_per_object_termwise_tiles([(sem_sim, [sem_sim.get_strategy()])], tile_size)
+        files = {(0, sem_sim.get_strategy()): file_per_disease}
+    else:
+        sem_sim = methods_diseasewise[names_diseasewise[chosen_measure]](thesaurus,annotation)
+        print('\t- Calculating per disease..')
+        tiles = sem_sim.iter_per_object_diseasewise_tiles(AnnotationIncidence(annotation, sem_sim.objects, sem_sim.descriptors), tile_size)
+        files = {None: file_per_disease}
+    print("\t -Writing file..")
+    writeTripletTiles(files, tiles, sem_sim)
+    sys.exit(0)
+
 if chosen_measure in names_termwise:
     method_pair = methods_termwise[names_termwise[chosen_measure]]
     sem_sim = method_pair[0](thesaurus, annotation,method_pair[1])
@@ -136,23 +184,23 @@ if chosen_measure in names_termwise:
     sem_sim.compute_semantic_similarity_per_object_termwise()
     #--------------
     ##per descriptor
-    cache_file = './Cache/combined_' + chosen_measure + '_' + str(categories_subset) +"_per_descriptor.txt"
-    if os.path.isfile(cache_file):
-        sem_sim.perDescriptor = np.loadtxt(cache_file,delimiter='\t')
+    cache_file = './Cache/combined_' + chosen_measure + '_' + str(categories_subset) +"_per_descriptor" + cache_ext
+    if is_current(cache_file):
+        sem_sim.load_per_descriptor(cache_file)
     else:
         print('\t\t- Computing per descriptor..')
         sem_sim.compute_semantic_similarity_per_descriptor()
         print('\t\t- Writing per descriptor')
-        np.savetxt(cache_file ,sem_sim.get_perDescriptor(),delimiter='\t', newline='\n')
+        sem_sim.save_per_descriptor(cache_file)
     #per object
-    cache_file = './Cache/'+ chosen_measure + "_combined_" +str(categories_subset) +"_per_disease.txt"
-    if os.path.isfile(cache_file):
-        sem_sim.perObject = np.loadtxt(cache_file,delimiter='\t')
+    cache_file = './Cache/'+ chosen_measure + "_combined_" +str(categories_subset) +"_per_disease" + cache_ext
+    if is_current(cache_file):
+        sem_sim.perObject = load_matrix(cache_file)
     else:
         print('\t\t- Computing per object..')
         sem_sim.compute_semantic_similarity_per_object_termwise()
         print('\t\t- Saving per disease')
-        np.savetxt(cache_file ,sem_sim.get_perObject(),delimiter='\t', newline='\n')
+        save_matrix(cache_file, sem_sim.get_perObject())
     ##--------------
     print('\t\t-Get LCA..')
     lowest_common_ancestor = sem_sim.get_lowestCommonAncestor()
@@ -167,8 +215,9 @@ print("\t -Writing file..")
 
 writeTriplet(file_per_disease, per_disease, sem_sim)
 
-print("\t -Write LCA...")
-writeSelectedDescriptor(file_per_disease +"-LCA", lowest_common_ancestor)
+if chosen_measure in names_termwise:
+    print("\t -Write LCA...")
+    writeSelectedDescriptor(file_per_disease +"-LCA", lowest_common_ancestor)
 
 if compute_ism == "YES":
     print("\t -Computing ISM for " + chosen_measure)
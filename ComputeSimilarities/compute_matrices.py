@@ -31,6 +31,7 @@ from annotation import *
 from semsim import *
 from similarity_measures import *
 from writeFiles import *
+from cache import *
 
 methods_termwise = {0: (Resnik,'MED'), 1:(Lin,'MED'), 2: (Jiang,'MED'), 3: (Schlicker, 'MAX')}
 names_termwise = {"RESNIK":0, "LIN":1, "JIANG":2, "SCHLICKER":3}
@@ -48,7 +49,7 @@ help_string = """
     --------------------------------------------------------------------------------------------------------------
     Usage:
     =====
-    python computed_matrices.py  descriptors_file annotation_file chosen_measure ism [filename_modifier].\nArguments in brackets are optional
+    python computed_matrices.py  descriptors_file annotation_file chosen_measure ism [filename_modifier] [--tile-size N] [--packed] [--float32].\nArguments in brackets are optional
 
     *Small format guide:
 
@@ -69,8 +70,14 @@ help_string = """
                     Resnik
                     Lin
                     Jiang
+                    Schlicker
                     SimUI
                     SimGIC
+            Several measures can be computed in a single run, sharing the annotation,
+            the information content and the most informative common ancestors, by giving
+            a comma separated list (or All). A term-wise measure can be followed by the
+            selection strategy (MAX, AVG, MED or ALFONSO), e.g. Resnik:MAX,Resnik:AVG,Lin,SimGIC
+            Files of non default strategies are named category_MEASURE_STRATEGY.
 
         ism:
             Determines whether the ISM will be computed for the selected measure. See:
@@ -83,10 +90,35 @@ help_string = """
         filename_modifier:
                 Appends a string modifier to the filename, for flexilibity mainly. If nothing is set, that's ok.
 
+        --packed, --float32:
+                Store the similarity matrices (per descriptor, per disease, and those of the ISM) as
+                their upper triangle only and/or in single precision, which together quarter the
+                memory. The caches are then written as .npy files with a .json metadata file.
+
+        --tile-size N:
+                Tiled (out-of-core) mode: the pairs of diseases are computed in N x N tiles and written
+                as they are finished, and the per descriptor matrices are memory-mapped caches
+                (./Cache/MEASURE_category_per_descriptor.npy) computed N rows at a time, so the memory
+                is bounded by the tile size. The per disease matrices are not cached, and the ISM,
+                which needs them in full, is not available in this mode.
+
     --------------------------------------------------------------------------------------------------------------
 """
 
 
+tile_size = 0
+if '--tile-size' in sys.argv:
+    position = sys.argv.index('--tile-size')
+    tile_size = int(sys.argv[position + 1])
+    del sys.argv[position:position + 2]
+
+#storage of the matrices (see SemanticSimilarity.set_storage); the caches are .npy files then.
+packed = '--packed' in sys.argv
+float32 = '--float32' in sys.argv
+sys.argv = [arg for arg in sys.argv if arg not in ('--packed', '--float32')]
+SemanticSimilarity.set_storage(packed, np.float32 if float32 else np.float64)
+cache_ext = '.npy' if packed or float32 else '.txt'
+
 if len(sys.argv) < 5:
     print(help_string)
     sys.exit(-1)
@@ -99,6 +131,148 @@ filename_modifier = ""
 if len(sys.argv) == 6:
     filename_modifier = "_" + sys.argv[5]
 
+#requested measures, as measure -> [strategies] (empty for disease-wise measures)
+requested = OrderedDict()
+for token in chosen_measure.replace('ALL', ','.join(list(names_termwise) + list(names_diseasewise))).split(','):
+    if not token.strip():
+        continue
+    (measure, _, strategy) = token.strip().partition(':')
+    if measure not in names_termwise and measure not in names_diseasewise:
+        print('Unknown measure ' + measure)
+        print(help_string)
+        sys.exit(-1)
+    strategies = requested.setdefault(measure, [])
+    if measure in names_termwise:
+        strategy = strategy or methods_termwise[names_termwise[measure]][1]
+        if strategy not in strategies:
+            strategies.append(strategy)
+multiple_measures = len(requested) > 1 or ':' in chosen_measure
+
+
+def write_similarities(name, per_disease, sem_sim, annotation):
+    print("\t- Writing " + name)
+    writeTriplet(name + filename_modifier, per_disease, sem_sim)
+    if compute_ism.upper() == "YES":
+        print("\t- computing ISM for "+ name)
+        ism = ISM(thesaurus, annotation,per_disease)
+        ism.ism()
+        writeTriplet(name + "_ISM", ism.getISM(), sem_sim)
+
+
+def compute_multiple_measures(cat, annotation):
+    """
+    Computes every requested measure on the annotation of a category. The
+    IC/MICA of the descriptors and the annotation incidence are computed once,
+    and all the term-wise measures and strategies share a single pass over
+    the pairs of diseases. As in the single measure mode, the LCA is written
+    when a per descriptor matrix is computed, once per category.
+    """
+    information_content = None
+    lca_written = False
+    incidence = None
+    termwise = []
+    for measure, strategies in requested.items():
+        print("\t- Computing " + measure)
+        if measure in names_diseasewise:
+            sem_sim = methods_diseasewise[names_diseasewise[measure]](thesaurus, annotation)
+            if incidence is None:
+                incidence = AnnotationIncidence(annotation, sem_sim.objects, sem_sim.descriptors)
+            sem_sim.compute_semantic_similarity_per_object_diseasewise_from_incidence(incidence)
+            write_similarities(cat + '_' + measure, sem_sim.get_perObject(), sem_sim, annotation)
+            continue
+
+        method_pair = methods_termwise[names_termwise[measure]]
+        sem_sim = method_pair[0](thesaurus, annotation, method_pair[1])
+        cache_file = './Cache/'+ measure + '_' +cat + '_per_descriptor' + cache_ext
+        if is_current(cache_file):
+            sem_sim.load_per_descriptor(cache_file)
+        else:
+            if information_content is None:
+                print('\t\t- Calculating information content..')
+                information_content = InformationContent(thesaurus, annotation, sem_sim.descriptors)
+            print('\t\t- Calculating  per descriptor..')
+            sem_sim.compute_semantic_similarity_per_descriptor_from_information_content(information_content)
+            print('\t\t- Writing per descriptor')
+            sem_sim.save_per_descriptor(cache_file)
+            if not lca_written:
+                writeSelectedDescriptor("LCA", sem_sim.get_lowestCommonAncestor())
+                lca_written = True
+        termwise.append((sem_sim, strategies))
+
+    #the per disease cache of the default strategy is shared with the single measure mode.
+    names = dict()
+    pending = []
+    for (sem_sim, strategies) in termwise:
+        measure = type(sem_sim).__name__.upper()
+        missing = []
+        for strategy in strategies:
+            suffix = '' if strategy == sem_sim.get_strategy() else '_' + strategy
+            names[(measure, strategy)] = (cat + '_' + measure + suffix, './Cache/'+ measure + suffix + "_" + cat +  '_per_disease' + cache_ext)
+            if not is_current(names[(measure, strategy)][1]):
+                missing.append(strategy)
+        if missing:
+            pending.append((sem_sim, missing))
+    computed = dict()
+    if pending:
+        print('\t\t- Calculating per disease...')
+        per_object = compute_per_object_termwise(pending)
+        for (k, strategy), matrix in per_object.items():
+            computed[(type(pending[k][0]).__name__.upper(), strategy)] = matrix
+    for (sem_sim, strategies) in termwise:
+        measure = type(sem_sim).__name__.upper()
+        for strategy in strategies:
+            (name, cache_file) = names[(measure, strategy)]
+            if (measure, strategy) in computed:
+                per_disease = computed[(measure, strategy)]
+                save_matrix(cache_file, per_disease)
+            else:
+                per_disease = load_matrix(cache_file)
+            write_similarities(name, per_disease, sem_sim, annotation)
+
+
+def compute_tiled(cat, annotation):
+    """
+    Tiled mode of compute_multiple_measures (see --tile-size): every finished
+    tile of disease pairs is written straight away.
+    """
+    information_content = None
+    termwise = []
+    files = dict()
+    for measure, strategies in requested.items():
+        print("\t- Computing " + measure)
+        if measure in names_diseasewise:
+            sem_sim = methods_diseasewise[names_diseasewise[measure]](thesaurus, annotation)
+            incidence = AnnotationIncidence(annotation, sem_sim.objects, sem_sim.descriptors)
+            print("\t- Writing " + cat + '_' + measure)
+            writeTripletTiles({None: cat + '_' + measure + filename_modifier},
+                              sem_sim.iter_per_object_diseasewise_tiles(incidence, tile_size), sem_sim)
+            continue
+
+        method_pair = methods_termwise[names_termwise[measure]]
+        sem_sim = method_pair[0](thesaurus, annotation, method_pair[1])
+        cache_file = './Cache/'+ measure + '_' +cat + '_per_descriptor.npy'
+        if is_current(cache_file):
+            sem_sim.load_per_descriptor(cache_file)
+        else:
+            if information_content is None:
+                print('\t\t- Calculating information content..')
+                information_content = InformationContent(thesaurus, annotation, sem_sim.descriptors)
+            print('\t\t- Calculating  per descriptor..')
+            out = create_matrix(cache_file, sem_sim.num_descriptors, sem_sim.packed, sem_sim.dtype)
+            sem_sim.compute_semantic_similarity_per_descriptor_tiled(information_content, out, tile_size)
+            commit_matrix(out, cache_file, normalisation=sem_sim.scaling)
+            sem_sim.perDescriptor = load_matrix(cache_file)
+        for strategy in strategies:
+            suffix = '' if strategy == sem_sim.get_strategy() else '_' + strategy
+            files[(len(termwise), strategy)] = cat + '_' + measure + suffix + filename_modifier
+        termwise.append((sem_sim, strategies))
+
+    if termwise:
+        print('\t\t- Calculating per disease...')
+        writeTripletTiles(files, iter_per_object_termwise_tiles(termwise, tile_size), termwise[0][0])
+    if compute_ism.upper() == "YES":
+        print("\t- The ISM is not computed in tiled mode")
+
 
 # 1.- we load up the thesaurus and get annotations
 parser = MeSHParser(descriptors_file, categories['ALL'])
@@ -113,33 +287,41 @@ for cat in sorted(categories):
     print("Processing category ", cat, "(", thesaurus.get_node(cat).get_name(), ")...")
     annotation = annotation_parser.get_annotations(cat)
 
+    if tile_size:
+        compute_tiled(cat, annotation)
+        continue
+
+    if multiple_measures:
+        compute_multiple_measures(cat, annotation)
+        continue
+
     print("\t- Computing " + chosen_measure)
     if chosen_measure in names_termwise:
         method_pair = methods_termwise[names_termwise[chosen_measure]]
         sem_sim = method_pair[0](thesaurus, annotation,method_pair[1])
         #check if cache holds
         ###########
-        cache_file = './Cache/'+ chosen_measure + '_' +cat + '_per_descriptor.txt'
-        if os.path.isfile(cache_file):
-            sem_sim.perDescriptor = np.loadtxt(cache_file,delimiter='\t')
+        cache_file = './Cache/'+ chosen_measure + '_' +cat + '_per_descriptor' + cache_ext
+        if is_current(cache_file):
+            sem_sim.load_per_descriptor(cache_file)
         else:
             print('\t\t- Calculating  per descriptor..')
             sem_sim.compute_semantic_similarity_per_descriptor()
             print('\t\t- Writing per descriptor')
-            np.savetxt(cache_file,sem_sim.get_perDescriptor(),delimiter='\t', newline='\n')
+            sem_sim.save_per_descriptor(cache_file)
             #print '\t\t-Get LCA..'
             LCA = sem_sim.get_lowestCommonAncestor()
             writeSelectedDescriptor("LCA", LCA)
         ###########
 
-        cache_file = './Cache/'+ chosen_measure + "_" + cat +  '_per_disease.txt'
-        if os.path.isfile(cache_file):
-            sem_sim.perObject = np.loadtxt(cache_file,delimiter='\t')
+        cache_file = './Cache/'+ chosen_measure + "_" + cat +  '_per_disease' + cache_ext
+        if is_current(cache_file):
+            sem_sim.perObject = load_matrix(cache_file)
         else:
             print('\t\t- Calculating per disease...')
             sem_sim.compute_semantic_similarity_per_object_termwise()
             print('\t\t- Saving per disease')
-            np.savetxt(cache_file,sem_sim.get_perObject(),delimiter='\t', newline='\n')
+            save_matrix(cache_file, sem_sim.get_perObject())
     elif chosen_measure in names_diseasewise:
         sem_sim = methods_diseasewise[names_diseasewise[chosen_measure]](thesaurus,annotation)
         print('\t\t- Calculating per disease...')
@@ -25,20 +25,129 @@ __version__ = "3"
 
 from thesaurus import *
 from annotation import *
+from storage import *
+from cache import *
+from strategies import DescriptorLists, distribution
 import numpy as np
+import scipy.sparse
 from collections import OrderedDict
 from rich.progress import track
 
+
+class InformationContent(object):
+    """
+    Intermediates shared by all the term-wise measures of an annotation:
+    the information content of every descriptor, IC(d) = -log10(N_d / N),
+    and, for every pair of descriptors, their most informative common
+    ancestor (MICA) and its IC. Descriptors are indexed following the order
+    of `descriptors`, which must be the one of the SemanticSimilarity
+    objects using it.
+
+    The full matrices (mica_ic, mica) are computed on first use; rows()
+    computes a block of rows only, for the tiled mode.
+    """
+    def __init__(self, thesaurus, annotation, descriptors):
+        self.descriptors = list(descriptors)
+        self.num_descriptors = len(self.descriptors)
+        num_objects = len(list(annotation.get_objects()))
+        indexes = dict(zip(self.descriptors, range(self.num_descriptors)))
+        counts = np.array([annotation.num_annot_per_descriptor(d) for d in self.descriptors], dtype=float)
+        self.ic = -1.0 * np.log10(counts / float(num_objects))
+
+        self.__ancestors = []
+        descendants = [[] for _ in range(self.num_descriptors)]
+        for i, desc in enumerate(self.descriptors):
+            anc = [indexes[n.get_identifier()] for n in thesaurus.get_node(desc).get_ancestors() if n.get_identifier() in indexes]
+            #most informative first, i.e. the least annotated.
+            anc.sort(key=lambda k: counts[k])
+            self.__ancestors.append(np.array(anc, dtype=np.int64))
+            for k in anc:
+                descendants[k].append(i)
+        self.__descendants = [np.array(d, dtype=np.int64) for d in descendants]
+        self.__mica_ic = None
+        self.__mica = None
+
+    def rows(self, start, end):
+        """
+        MICA (index, -1 if there is none) and its IC for the descriptors
+        start..end-1 against every descriptor.
+        """
+        mica_ic = np.zeros((end - start, self.num_descriptors))
+        mica = np.full((end - start, self.num_descriptors), -1, dtype=np.int32)
+        for i in range(start, end):
+            row = mica[i - start]
+            #ancestors in decreasing IC order: the first one covering a descriptor is the MICA.
+            for k in self.__ancestors[i]:
+                targets = self.__descendants[k]
+                targets = targets[row[targets] < 0]
+                row[targets] = k
+                mica_ic[i - start, targets] = self.ic[k]
+        return mica_ic, mica
+
+    def __compute(self):
+        (self.__mica_ic, self.__mica) = self.rows(0, self.num_descriptors)
+
+    @property
+    def mica_ic(self):
+        if self.__mica_ic is None:
+            self.__compute()
+        return self.__mica_ic
+
+    @property
+    def mica(self):
+        if self.__mica is None:
+            self.__compute()
+        return self.__mica
+
+
+class AnnotationIncidence(object):
+    """
+    Sparse object x descriptor incidence matrix of an (up-propagated)
+    annotation, following the order of `objects` and `descriptors`.
+    """
+    def __init__(self, annotation, objects, descriptors):
+        descriptor_indexes = dict(zip(descriptors, range(len(descriptors))))
+        rows = []
+        cols = []
+        for i, obj in enumerate(objects):
+            for desc in annotation.get_descriptors_per_object(obj):
+                rows.append(i)
+                cols.append(descriptor_indexes[desc])
+        self.matrix = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                              shape=(len(objects), len(descriptors)))
+
+    def num_annot_per_descriptor(self):
+        return np.asarray(self.matrix.sum(axis=0)).ravel()
+
 class SemanticSimilarity(object):
 
+    #storage of the per descriptor and per object matrices, see set_storage.
+    packed = False
+    dtype = np.float64
+    #rows computed at once when filling packed matrices.
+    block_size = 1000
+
+    @classmethod
+    def set_storage(cls, packed=False, dtype=np.float64):
+        """
+        Stores the per descriptor and per object matrices of all the measures
+        as upper triangles (SymmetricMatrix) and/or with another dtype
+        (e.g. np.float32), which together quarter their memory.
+        """
+        cls.packed = packed
+        cls.dtype = np.dtype(dtype).type
+
     def __init__(self, thesaurus, annotation):
         self.annotation = annotation
         self.thesaurus = thesaurus
         self.objects = list(self.annotation.get_objects())
-        self.descriptors = list(self.annotation.get_descriptors())
+        #sorted, so the order (and the per descriptor caches) does not depend on the run.
+        self.descriptors = sorted(self.annotation.get_descriptors())
         self.num_objects = len(self.objects)
         self.num_descriptors = len(self.descriptors)
         self.lowestCommonAncestor = defaultdict(list)
+        #normalisation applied to the per descriptor matrix, stored with its cache.
+        self.scaling = dict()
         self.selectedPair = defaultdict(list)
 
         self.object_indexes = OrderedDict()
@@ -64,6 +173,17 @@ class SemanticSimilarity(object):
         except:
             raise
 
+    def save_per_descriptor(self, cache_file):
+        save_matrix(cache_file, self.perDescriptor, normalisation=self.scaling)
+
+    def load_per_descriptor(self, cache_file):
+        """
+        Loads a current per descriptor cache (see cache.is_current), already
+        normalised, with the normalisation recorded in its metadata.
+        """
+        self.perDescriptor = load_matrix(cache_file)
+        self.scaling = read_metadata(cache_file).get('normalisation', dict())
+
     def get_perObject(self):
         try:
             return self.perObject
@@ -74,6 +194,13 @@ class SemanticSimilarity(object):
         return self.selectedPair
 
     def get_lowestCommonAncestor(self):
+        #when computed from the shared information content, it is built on demand.
+        if not self.lowestCommonAncestor and getattr(self, 'information_content', None) is not None:
+            mica = self.information_content.mica
+            for i in range(self.num_descriptors):
+                desc1 = self.descriptors[i]
+                for j in range(i, self.num_descriptors):
+                    self.lowestCommonAncestor[desc1].append((self.descriptors[j], self.descriptors[mica[i, j]], self.perDescriptor[i, j]))
         return self.lowestCommonAncestor
 
 
@@ -90,8 +217,29 @@ class SemanticSimilarity(object):
 
 
 
+    def compute_semantic_similarity_per_object_diseasewise_from_incidence(self, incidence):
+        """
+        Same as compute_semantic_similarity_per_object_diseasewise, for the
+        measures that are weighted Jaccard indexes over the descriptors of each
+        object: all pairs come from a single sparse product.
+        """
+        X = incidence.matrix
+        weights = self.descriptor_weights(incidence)
+        Xw = X.multiply(weights.reshape(1, -1)).tocsr()
+        sizes = X @ weights
+        self.perObject = new_symmetric(self.num_objects, self.packed, self.dtype)
+        #packed matrices are filled a block of rows at a time.
+        block_size = self.block_size if self.packed else max(self.num_objects, 1)
+        for start in range(0, self.num_objects, block_size):
+            end = min(start + block_size, self.num_objects)
+            intersection = (Xw[start:end] @ X.T).toarray()
+            union = sizes[start:end].reshape(-1, 1) + sizes.reshape(1, -1) - intersection
+            block = np.zeros(intersection.shape)
+            np.divide(intersection, union, out=block, where=union > 0)
+            self.perObject[start:end] = block
+
     def compute_semantic_similarity_per_object_diseasewise(self):
-        self.perObject = np.zeros((self.num_objects, self.num_objects))
+        self.perObject = new_symmetric(self.num_objects, self.packed, self.dtype)
         for dis1 in track(range(self.num_objects), description="Computing semantic similarity..."):
             for dis2 in range(dis1, self.num_objects):
                 similarity = self.semantic_similarity(self.objects[dis1], self.objects[dis2])
@@ -101,27 +249,77 @@ class SemanticSimilarity(object):
 
     def compute_semantic_similarity_per_object_termwise(self):
 
-        self.perObject = np.zeros((self.num_objects, self.num_objects))
+        self.perObject = new_symmetric(self.num_objects, self.packed, self.dtype)
         descriptors_id_per_object = self.__get_descriptors_ids_per_object()
+        descriptor_lists = DescriptorLists([descriptors_id_per_object[i] for i in range(self.num_objects)])
         with open('./localStore/sim_distribution','w') as f:
             f.write('#disease A\tdisease B\tmax_similarity\tmin_similarity\tmean_similarity\tmedian_similarity\tstandard_deviation\n')
             for i in track(range(self.num_objects), description="Computing term-wise similarity..."):
-                rows = self.perDescriptor[ descriptors_id_per_object[i] ]
-                for j in range(i, self.num_objects):
-                    similarity = self.selectionStrategy(rows[:,descriptors_id_per_object[j]])
-
-                    submat = rows[:,descriptors_id_per_object[j]]
-                    mean = np.mean(submat)
-                    median = np.median(submat)
-                    std_dev = np.std(submat)
-                    f.write(self.objects[i] + '\t' + self.objects[j] + '\t' + str(np.max(submat)) + '\t' + str(np.min(submat)) + '\t' + str(mean) + '\t' + str(median) + '\t' + str(std_dev)+'\n')
-                    self.perObject[i, j] = similarity
-                    self.perObject[j, i] = similarity
-
+                rows = self.perDescriptor[ descriptor_lists[i] ]
+                #a batch of objects j >= i at a time (see strategies.py)
+                for (first, columns, starts, lengths) in descriptor_lists.batches(i, self.num_objects):
+                    last = first + len(starts)
+                    submat = rows[:, columns]
+                    similarity = self.select_batch(submat, starts, lengths, self.get_strategy())
+                    (maximum, minimum, mean, median, std_dev) = distribution(submat, starts, lengths)
+                    for k, j in enumerate(range(first, last)):
+                        f.write(self.objects[i] + '\t' + self.objects[j] + '\t' + str(maximum[k]) + '\t' + str(minimum[k]) + '\t' + str(mean[k]) + '\t' + str(median[k]) + '\t' + str(std_dev[k])+'\n')
+                    self.perObject[i, first:last] = similarity
+                    self.perObject[first:last, i] = similarity
+
+
+    def compute_semantic_similarity_per_descriptor_from_information_content(self, information_content):
+        """
+        Same as compute_semantic_similarity_per_descriptor, deriving every
+        pair from the precomputed IC and MICA (see InformationContent).
+        """
+        if self.packed:
+            out = new_symmetric(self.num_descriptors, True, self.dtype)
+            self.compute_semantic_similarity_per_descriptor_tiled(information_content, out, self.block_size)
+            return
+        self.information_content = information_content
+        ic = information_content.ic
+        self.perDescriptor = self.similarity_from_information_content(information_content.mica_ic, ic.reshape(-1, 1), ic.reshape(1, -1)).astype(self.dtype, copy=False)
+        self.scaling = self.normalise(self.perDescriptor) or dict()
+
+    def compute_semantic_similarity_per_descriptor_tiled(self, information_content, out, tile_size):
+        """
+        Same as compute_semantic_similarity_per_descriptor_from_information_content,
+        filling `out` (usually a memory-mapped cache, see cache.py) tile_size
+        rows at a time, so only a tile of the MICA matrix is in memory.
+        """
+        self.information_content = information_content
+        ic = information_content.ic
+        for start in track(range(0, self.num_descriptors, tile_size), description="Computing semantic similarity per descriptor..."):
+            end = min(start + tile_size, self.num_descriptors)
+            (mica_ic, _) = information_content.rows(start, end)
+            out[start:end] = self.similarity_from_information_content(mica_ic, ic[start:end].reshape(-1, 1), ic.reshape(1, -1))
+        self.scaling = self.normalise(out) or dict()
+        self.perDescriptor = out
+
+    def iter_per_object_diseasewise_tiles(self, incidence, tile_size):
+        """
+        Tiled version of compute_semantic_similarity_per_object_diseasewise_from_incidence.
+        Yields (first row, first column, {None: block}) for the tiles on or
+        above the diagonal; the pairs below the diagonal of a block are not meaningful.
+        """
+        X = incidence.matrix
+        weights = self.descriptor_weights(incidence)
+        Xw = X.multiply(weights.reshape(1, -1)).tocsr()
+        sizes = X @ weights
+        for i0 in range(0, self.num_objects, tile_size):
+            i1 = min(i0 + tile_size, self.num_objects)
+            for j0 in range(i0, self.num_objects, tile_size):
+                j1 = min(j0 + tile_size, self.num_objects)
+                intersection = (Xw[i0:i1] @ X[j0:j1].T).toarray()
+                union = sizes[i0:i1].reshape(-1, 1) + sizes[j0:j1].reshape(1, -1) - intersection
+                block = np.zeros(intersection.shape)
+                np.divide(intersection, union, out=block, where=union > 0)
+                yield i0, j0, {None: block}
 
     def compute_semantic_similarity_per_descriptor(self):
 
-        self.perDescriptor = np.zeros((self.num_descriptors, self.num_descriptors))
+        self.perDescriptor = new_symmetric(self.num_descriptors, self.packed, self.dtype)
         max_dist = -1000
         for i in track(range(self.num_descriptors), description="Computing semantic similarity per descriptor..."):
             desc1 = self.descriptors[i]
@@ -136,6 +334,76 @@ class SemanticSimilarity(object):
 
         #we need to call a normalisation function because of jiang. Each measure 
         #implemets their own normalisation if needed.
-        self.normalise(self.perDescriptor)
-
-
+        self.scaling = self.normalise(self.perDescriptor) or dict()
+
+
+
+
+def compute_per_object_termwise(similarities):
+    """
+    Computes the per object matrices of several term-wise measures and
+    selection strategies in a single pass over the pairs of objects.
+    `similarities` is a list of (SemanticSimilarity, [strategies]) with
+    their per descriptor matrices computed, all sharing the same annotation.
+    Returns a dictionary (index in `similarities`, strategy) -> matrix
+    """
+    reference = similarities[0][0]
+    num_objects = reference.num_objects
+    descriptors_id_per_object = [[reference.descriptors_indexes[j] for j in reference.annotation.get_direct_annotations(obj)]
+                                 for obj in reference.objects]
+    per_object = dict()
+    for k, (sem_sim, strategies) in enumerate(similarities):
+        for strategy in strategies:
+            per_object[(k, strategy)] = new_symmetric(num_objects, sem_sim.packed, sem_sim.dtype)
+    descriptor_lists = DescriptorLists(descriptors_id_per_object)
+    for i in track(range(num_objects), description="Computing term-wise similarity..."):
+        rows = [sem_sim.perDescriptor[descriptor_lists[i]] for (sem_sim, _) in similarities]
+        for (first, columns, starts, lengths) in descriptor_lists.batches(i, num_objects):
+            last = first + len(starts)
+            for k, (sem_sim, strategies) in enumerate(similarities):
+                submat = rows[k][:, columns]
+                for strategy in strategies:
+                    similarity = sem_sim.select_batch(submat, starts, lengths, strategy)
+                    per_object[(k, strategy)][i, first:last] = similarity
+                    per_object[(k, strategy)][first:last, i] = similarity
+    return per_object
+
+
+def iter_per_object_termwise_tiles(similarities, tile_size):
+    """
+    Tiled version of compute_per_object_termwise: the pairs of objects are
+    computed in tile_size x tile_size tiles, on or above the diagonal, and
+    only the descriptor rows and columns annotating the objects of a tile
+    are read from the (possibly memory-mapped) per descriptor matrices.
+    Yields (first row, first column, {(index in `similarities`, strategy): block});
+    the pairs below the diagonal of a block are not meaningful.
+    """
+    reference = similarities[0][0]
+    num_objects = reference.num_objects
+    descriptors_id_per_object = [np.array([reference.descriptors_indexes[j] for j in reference.annotation.get_direct_annotations(obj)], dtype=np.int64)
+                                 for obj in reference.objects]
+
+    def descriptor_block(start, end):
+        #descriptors annotating the objects start..end-1, and their positions in that list.
+        ids = np.unique(np.concatenate(descriptors_id_per_object[start:end]))
+        return ids, DescriptorLists([np.searchsorted(ids, descriptors_id_per_object[i]) for i in range(start, end)])
+
+    for i0 in track(range(0, num_objects, tile_size), description="Computing term-wise similarity..."):
+        i1 = min(i0 + tile_size, num_objects)
+        (row_ids, row_local) = descriptor_block(i0, i1)
+        for j0 in range(i0, num_objects, tile_size):
+            j1 = min(j0 + tile_size, num_objects)
+            (col_ids, col_local) = descriptor_block(j0, j1)
+            blocks = dict()
+            for k, (sem_sim, strategies) in enumerate(similarities):
+                sub_block = np.asarray(sem_sim.perDescriptor[np.ix_(row_ids, col_ids)])
+                for strategy in strategies:
+                    blocks[(k, strategy)] = np.zeros((i1 - i0, j1 - j0), dtype=sem_sim.dtype)
+                for i in range(i0, i1):
+                    rows = sub_block[row_local[i - i0]]
+                    first = max(i, j0) - j0
+                    (columns, starts, lengths) = col_local.batch(first, j1 - j0)
+                    submat = rows[:, columns]
+                    for strategy in strategies:
+                        blocks[(k, strategy)][i - i0, first:] = sem_sim.select_batch(submat, starts, lengths, strategy)
+            yield i0, j0, blocks
@@ -3,6 +3,7 @@ from annotation import *
 from mesh_parser import MeSHParser
 from writeFiles import *
 from semsim import *
+import strategies
 #--
 import numpy as np
 import sys
@@ -30,6 +31,9 @@ class SimUI(SemanticSimilarity):
         self.__thesaurus = thesaurus
         super(SimUI, self).__init__(thesaurus,annotation)
 
+    def descriptor_weights(self, incidence):
+        return np.ones(incidence.matrix.shape[1])
+
     def semantic_similarity(self, disease1, disease2):
         MeSH1 = set(self.annotation.get_descriptors_per_object(disease1))
         MeSH2 = set(self.annotation.get_descriptors_per_object(disease2))
@@ -48,6 +52,9 @@ class SimGIC(SemanticSimilarity):
         self.__thesaurus = thesaurus
         super(SimGIC, self).__init__(thesaurus,annotation)
 
+    def descriptor_weights(self, incidence):
+        return incidence.num_annot_per_descriptor()
+
     def semantic_similarity(self, disease1, disease2):
         MeSH1 = set(self.annotation.get_descriptors_per_object(disease1))
         MeSH2 = set(self.annotation.get_descriptors_per_object(disease2))
@@ -78,25 +85,38 @@ class Resnik(SemanticSimilarity):
         selectedAncestor = common_ancestors[number_of_annotations.index(min_annot)]
         return (selectedAncestor.get_identifier(), value)
 
+    def similarity_from_information_content(self, mica_ic, ic1, ic2):
+        return mica_ic.copy()
+
     def get_descriptor_indexes(self):
         return super(Resnik, self).get_descriptor_indexes()
 
     def normalise(self,out):
         return
 
+    def get_strategy(self):
+        return self.__strategy.upper()
+
     def selectionStrategy(self,values):
-        if self.__strategy.upper() == "MAX":
+        return self.select(values, self.__strategy)
+
+    def select(self, values, strategy):
+        if strategy.upper() == "MAX":
             selected_value = np.amax(values)
-        if self.__strategy.upper() == "AVG":
+        if strategy.upper() == "AVG":
             selected_value = np.mean(values)
-        if self.__strategy.upper() == "MED":
+        if strategy.upper() == "MED":
             selected_value = np.median(values)
-        if self.__strategy.upper() == "ALFONSO":
+        if strategy.upper() == "ALFONSO":
             selected_row = np.amax(values,1)
             selected_col = np.amax(values,0)
             selected_value = np.mean(np.concatenate([selected_row,selected_col]))
         return selected_value
 
+    def select_batch(self, values, starts, lengths, strategy):
+        #same as select, for a batch of pairs (see strategies.py)
+        return strategies.select(values, starts, lengths, strategy)
+
     def get_lowestCommonAncestor(self):
         return super(Resnik,self).get_lowestCommonAncestor()
     
@@ -118,6 +138,10 @@ class Schlicker(Resnik):
         value = lin_similarity * (1 - (np.exp(-resnik[1])))
         return (resnik[0], value)
 
+    def similarity_from_information_content(self, mica_ic, ic1, ic2):
+        lin = Lin.similarity_from_information_content(self, mica_ic, ic1, ic2)
+        return lin * (1 - np.exp(-mica_ic))
+
 
     #just in case there is some normalisation involved.
     def normalise(self,out):
@@ -146,6 +170,13 @@ class Lin(Resnik):
             value = float((-2.0*resnik[1]))/float(logp1+logp2)
         return (resnik[0], value)
 
+    def similarity_from_information_content(self, mica_ic, ic1, ic2):
+        #logp = -IC
+        total = ic1 + ic2
+        value = np.zeros(mica_ic.shape)
+        np.divide(2.0 * mica_ic, total, out=value, where=total != 0)
+        return value
+
     #just in case there is some normalisation involved.
     def normalise(self,out):
         return 
@@ -168,9 +199,20 @@ class Jiang(Resnik):
         value = -2.0 * resnik[1] - logp1 - logp2
         return (resnik[0],value)
 
+    def similarity_from_information_content(self, mica_ic, ic1, ic2):
+        return ic1 + ic2 - 2.0 * mica_ic
+
     def normalise(self,out):
-        out = np.subtract(1, np.divide(out,float(np.max(out))))
-        return
+        #Jiang is a distance: similarity = 1 - distance / max distance. Done in place,
+        #a block of rows at a time, as `out` may be a large memory map.
+        max_distance = max_value(out, self.block_size)
+        if max_distance is None or max_distance <= 0:
+            #no descriptors, or all of them at distance 0.
+            max_distance = 1.0
+        for block in row_blocks(out, self.block_size):
+            np.divide(block, max_distance, out=block)
+            np.subtract(1, block, out=block)
+        return {'method': 'jiang', 'max_distance': float(max_distance)}
 
     def selectionStrategy(self,values):
         value = super(Jiang,self).selectionStrategy(values)
@@ -202,7 +244,8 @@ class ISM(object):
         self.W = np.matrix(np.identity(len(self.descriptors)))
         self.epsilon = float(0.001)
         self.B = np.zeros((len(self.__leaves), len(self.objects)))
-        self.RWC = np.zeros((len(self.objects),len(self.objects)))
+        #same storage (packed, dtype) as the HSM.
+        self.RWC = zeros_like(HSM)
         self.HSM = HSM
         self.ISM = np.zeros((len(self.descriptors),len(self.descriptors)))
 
@@ -217,7 +260,10 @@ class ISM(object):
         ##compute genewise
         self.__genewise()
         ##final combinations
-        self.ISM = 0.5 * (self.RWC + self.HSM)
+        if isinstance(self.HSM, SymmetricMatrix):
+            self.ISM = SymmetricMatrix(self.HSM.n, data=0.5 * (self.RWC.data + self.HSM.data))
+        else:
+            self.ISM = 0.5 * (self.RWC + self.HSM)
         
     def getISM(self):
         return self.ISM
@@ -290,8 +336,8 @@ class ISM(object):
             a = np.transpose(self.B[:,i])
             for j in range(i,n):
                 b = self.B[:,j]
-                combinedSum = a*b
-                self.RWC[i][j] = combinedSum / (float(sum_col[i] + sum_col[j]) - combinedSum)
+                combinedSum = (a*b).item()
+                self.RWC[i, j] = combinedSum / (float(sum_col[i] + sum_col[j]) - combinedSum)
         print("Done!")
 
 
@@ -0,0 +1,164 @@
+"""
+    Computes semantic similarity in the MeSH ontologies.
+    Copyright (C) 2015 Horacio Caniza
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+__author__  = "Horacio Caniza"
+__email__   = "h.j.canizavierci@cs.rhul.ac.uk"
+__copyright__ = "Copyright (C) 2015 Horacio Caniza"
+__license__ = "GPL"
+__version__ = "3"
+
+"""
+Storage of the symmetric similarity matrices (per descriptor, per object,
+RWC and HSM): either dense numpy arrays or SymmetricMatrix, which keeps the
+upper triangle only, and either float64 or float32.
+"""
+
+import numpy as np
+
+#rows expanded at once by SymmetricMatrix.max along an axis.
+MAX_ROWS = 256
+
+
+class SymmetricMatrix(object):
+    """
+    Symmetric n x n matrix stored as its upper triangle (diagonal included),
+    row by row, in a vector of n (n + 1) / 2 values, which may be a memory
+    map. It is indexed like a dense array:
+
+        m[i, j]             value of a pair, m[j, i] is the same value
+        m[rows, cols]       broadcast like numpy, e.g. m[np.ix_(rows, cols)]
+        m[rows]             dense rows (an index, a list or a slice)
+    """
+    def __init__(self, n, dtype=np.float64, data=None):
+        self.n = n
+        if data is None:
+            data = np.zeros(n * (n + 1) // 2, dtype=dtype)
+        self.data = data
+        self.dtype = self.data.dtype
+
+    @property
+    def shape(self):
+        return (self.n, self.n)
+
+    def offset(self, i):
+        """Position of the diagonal element of row(s) i in data."""
+        i = np.asarray(i, dtype=np.int64)
+        return i * self.n - i * (i - 1) // 2
+
+    def index(self, i, j):
+        """Position of the pair(s) (i, j) in data."""
+        i = np.asarray(i, dtype=np.int64)
+        j = np.asarray(j, dtype=np.int64)
+        low = np.minimum(i, j)
+        return self.offset(low) + np.maximum(i, j) - low
+
+    def __rows(self, key):
+        if isinstance(key, slice):
+            return np.arange(self.n)[key]
+        return key
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            (i, j) = key
+            return self.data[self.index(self.__rows(i), self.__rows(j))]
+        rows = self.take(self.__rows(key), np.arange(self.n))
+        #a single row index gives a vector, as in numpy.
+        return rows[0] if np.ndim(key) == 0 and not isinstance(key, slice) else rows
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            (i, j) = key
+            self.data[self.index(self.__rows(i), self.__rows(j))] = value
+            return
+        #whole rows: only their upper part is kept.
+        rows = np.atleast_1d(self.__rows(key))
+        value = np.broadcast_to(value, (len(rows), self.n))
+        for k, i in enumerate(rows):
+            self.data[self.offset(i):self.offset(i + 1)] = value[k, i:]
+
+    def take(self, rows, cols):
+        """Dense len(rows) x len(cols) block."""
+        return self[np.ix_(np.atleast_1d(rows), np.atleast_1d(cols))]
+
+    def max(self, axis=None, out=None):
+        """
+        Maximum of all the values or, with axis 0 or 1, of every row (the
+        same as of every column), computed on dense blocks of MAX_ROWS rows.
+        """
+        if axis is None:
+            result = self.data.max()
+        elif axis in (0, 1, -1, -2):
+            result = np.empty(self.n, dtype=self.dtype)
+            cols = np.arange(self.n)
+            for start in range(0, self.n, MAX_ROWS):
+                rows = np.arange(start, min(start + MAX_ROWS, self.n))
+                result[rows] = self.take(rows, cols).max(axis=1)
+        else:
+            raise ValueError('axis ' + str(axis) + ' is out of bounds for a symmetric matrix')
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+    def toarray(self):
+        return self.take(np.arange(self.n), np.arange(self.n))
+
+    @classmethod
+    def from_dense(cls, matrix, dtype=None):
+        packed = cls(matrix.shape[0], dtype or matrix.dtype)
+        packed[:] = matrix
+        return packed
+
+
+def row_blocks(matrix, block_size):
+    """
+    Writable views of `matrix` covering its stored values, block_size rows
+    at a time, to transform large (possibly memory-mapped) matrices in place.
+    """
+    if isinstance(matrix, SymmetricMatrix):
+        step = max(block_size, 1) * max(matrix.n, 1)
+        for start in range(0, len(matrix.data), step):
+            yield matrix.data[start:start + step]
+        return
+    for start in range(0, matrix.shape[0], max(block_size, 1)):
+        yield matrix[start:start + block_size]
+
+
+def max_value(matrix, block_size):
+    """Maximum of `matrix`, read a block at a time; None if it is empty."""
+    maximum = None
+    for block in row_blocks(matrix, block_size):
+        if block.size:
+            value = block.max()
+            maximum = value if maximum is None else max(maximum, value)
+    return maximum
+
+
+def new_symmetric(n, packed=False, dtype=np.float64):
+    """Zero n x n symmetric matrix with the given storage."""
+    if packed:
+        return SymmetricMatrix(n, dtype)
+    return np.zeros((n, n), dtype=dtype)
+
+
+def zeros_like(matrix):
+    """Zero matrix with the shape and storage of `matrix`."""
+    if isinstance(matrix, SymmetricMatrix):
+        return SymmetricMatrix(matrix.n, matrix.dtype)
+    return np.zeros(matrix.shape, dtype=matrix.dtype)
@@ -0,0 +1,110 @@
+"""
+    Computes semantic similarity in the MeSH ontologies.
+    Copyright (C) 2015 Horacio Caniza
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+__author__  = "Horacio Caniza"
+__email__   = "h.j.canizavierci@cs.rhul.ac.uk"
+__copyright__ = "Copyright (C) 2015 Horacio Caniza"
+__license__ = "GPL"
+__version__ = "3"
+
+"""
+Selection strategies of the term-wise measures over batches of pairs of
+objects. An object i is compared with a batch of objects j at once through
+a single block
+
+    block = perDescriptor[descriptors of i][:, descriptors of j1 + ... + jk]
+
+whose columns are the descriptor lists of the objects of the batch laid
+one after the other (CSR order): object j owns the columns
+starts[j] .. starts[j] + lengths[j] - 1. Every kernel reduces the
+segments of the block with ufunc reductions (reduceat) instead of a Python
+call per pair. Every object must have at least one descriptor.
+"""
+
+import numpy as np
+
+#objects compared at once with an object, bounds the size of the blocks.
+BATCH_SIZE = 512
+
+
+class DescriptorLists(object):
+    """
+    Descriptor indexes of every object in CSR form: the descriptors of
+    object i are indices[indptr[i]:indptr[i + 1]].
+    """
+    def __init__(self, descriptors_id_per_object):
+        lengths = [len(ids) for ids in descriptors_id_per_object]
+        self.indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.indices = np.concatenate([np.asarray(ids, dtype=np.int64) for ids in descriptors_id_per_object]) if lengths else np.array([], dtype=np.int64)
+
+    def __getitem__(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def batch(self, start, end):
+        """(columns, starts, lengths) of the objects start..end-1."""
+        columns = self.indices[self.indptr[start]:self.indptr[end]]
+        starts = self.indptr[start:end] - self.indptr[start]
+        lengths = np.diff(self.indptr[start:end + 1])
+        return columns, starts, lengths
+
+    def batches(self, start, end, batch_size=BATCH_SIZE):
+        """Yields (first object, columns, starts, lengths) for the objects start..end-1."""
+        for first in range(start, end, batch_size):
+            last = min(first + batch_size, end)
+            yield (first,) + self.batch(first, last)
+
+
+def median(block, starts, lengths):
+    """Median of every segment; segments of the same length are partitioned together."""
+    values = np.empty(len(starts))
+    for length in np.unique(lengths):
+        members = np.flatnonzero(lengths == length)
+        columns = starts[members].reshape(-1, 1) + np.arange(length)
+        #members x (rows * length)
+        gathered = block[:, columns].transpose(1, 0, 2).reshape(len(members), -1)
+        values[members] = np.median(gathered, axis=1)
+    return values
+
+
+def select(block, starts, lengths, strategy):
+    """Value of the selection strategy (MAX, AVG, MED or ALFONSO) for every segment."""
+    strategy = strategy.upper()
+    if strategy == "MAX":
+        return np.maximum.reduceat(block.max(axis=0), starts)
+    if strategy == "AVG":
+        return np.add.reduceat(block.sum(axis=0), starts) / (block.shape[0] * lengths)
+    if strategy == "MED":
+        return median(block, starts, lengths)
+    if strategy == "ALFONSO":
+        #best match average: the best match of every row and every column.
+        row_max = np.maximum.reduceat(block, starts, axis=1)
+        col_max = np.add.reduceat(block.max(axis=0), starts)
+        return (row_max.sum(axis=0) + col_max) / (block.shape[0] + lengths)
+    raise ValueError('Unknown selection strategy ' + strategy)
+
+
+def distribution(block, starts, lengths):
+    """(max, min, mean, median, standard deviation) of every segment."""
+    sizes = block.shape[0] * lengths
+    maximum = np.maximum.reduceat(block.max(axis=0), starts)
+    minimum = np.minimum.reduceat(block.min(axis=0), starts)
+    mean = np.add.reduceat(block.sum(axis=0), starts) / sizes
+    deviations = (block - np.repeat(mean, lengths).reshape(1, -1)) ** 2
+    std_dev = np.sqrt(np.add.reduceat(deviations.sum(axis=0), starts) / sizes)
+    return maximum, minimum, mean, median(block, starts, lengths), std_dev
@@ -23,16 +23,66 @@ __copyright__ = "Copyright (C) 2015 Horacio Caniza"
 __license__ = "GPL"
 __version__ = "3"
 
+import os
+import sys
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import binary_format
+
+#name of a triplet file in ./localStore; with $DISSIM_FORMAT=binary the
+#triplets are written as a binary file (Common/binary_format.py), name.npd
+def tripletPath(name):
+    return "./localStore/" + name + binary_format.output_suffix()
+
 #writes the triplet file.
 def writeTriplet(file_per_disease,per_disease,sem_sim):
-    with open("./localStore/"+ file_per_disease, "w") as f_dis:
+    filename = tripletPath(file_per_disease)
+    if binary_format.wants_binary(filename):
+        writer = binary_format.TripletWriter(filename, sem_sim.objects)
         for i in range(per_disease.shape[0]):
+            row = np.asarray(per_disease[i])[i:]
+            j = np.flatnonzero(row)
+            writer.add(np.full(len(j), i), j + i, row[j])
+        writer.close()
+        return
+    with open(filename, "w") as f_dis:
+        for i in range(per_disease.shape[0]):
+            #a row at a time, also for packed (SymmetricMatrix) matrices.
+            row = per_disease[i]
             for j in range(i, per_disease.shape[1]):
-                if per_disease[i,j] != 0.0:
-                    f_dis.write(sem_sim.objects[i] + "\t" + sem_sim.objects[j] + "\t" + str(per_disease[i,j]) + "\n") 
+                if row[j] != 0.0:
+                    f_dis.write(sem_sim.objects[i] + "\t" + sem_sim.objects[j] + "\t" + str(row[j]) + "\n") 
 
 def writeSelectedDescriptor(outfile, values):
     with open("./localStore/"+outfile, "w") as f:
         for key in values:
             for elements in values[key]:
                 f.write(str(key) + '\t' +  str(elements[0]) + "\t" +  str(elements[1]) + '\t' + str(elements[2]) + "\n")
+
+#writes the triplet files of the tiles yielded by the tiled computations, as
+#they are produced. `files` maps the keys of the blocks to file names; lines
+#are grouped by tile.
+def writeTripletTiles(files, tiles, sem_sim):
+    filenames = dict((key, tripletPath(name)) for key, name in files.items())
+    if any(binary_format.wants_binary(f) for f in filenames.values()):
+        writers = dict((key, binary_format.TripletWriter(f, sem_sim.objects)) for key, f in filenames.items())
+        for (i0, j0, blocks) in tiles:
+            for key, block in blocks.items():
+                (i, j) = np.nonzero(block)
+                keep = i0 + i <= j0 + j
+                writers[key].add(i0 + i[keep], j0 + j[keep], np.asarray(block)[i[keep], j[keep]])
+        for writer in writers.values():
+            writer.close()
+        return
+    handles = dict((key, open(f, "w")) for key, f in filenames.items())
+    try:
+        for (i0, j0, blocks) in tiles:
+            for key, block in blocks.items():
+                f_dis = handles[key]
+                for i in range(block.shape[0]):
+                    for j in range(max(i0 + i, j0) - j0, block.shape[1]):
+                        if block[i, j] != 0.0:
+                            f_dis.write(sem_sim.objects[i0 + i] + "\t" + sem_sim.objects[j0 + j] + "\t" + str(block[i, j]) + "\n")
+    finally:
+        for f_dis in handles.values():
+            f_dis.close()
@@ -1,50 +1,130 @@
 #!/usr/bin/python
 
+"""Maps each OMIM record to the MeSH terms of its associated publications.
+
+The mapping is a hash join on the PubMed identifier: the smaller of the two
+input files is loaded in memory (build side) and the larger one is streamed
+(probe side). Descriptors are deduplicated per MIM number; optionally the
+number of publications citing each descriptor is kept as a weight:
+
+    mim\tdescriptor:count\t...\tdescriptor:count
+
+Any of the files can be a binary mapping (Common/binary_format.py); the
+output is written in binary form if its name ends in .npd.
+"""
+
+import os
 import sys
-from collections import defaultdict
+from collections import defaultdict, Counter
 from rich.progress import track
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import loaders
+import binary_format
+
+#number of output lines accumulated before each write.
+CHUNK_LINES = 10000
+WRITE_BUFFER = 4 * 1024 * 1024
 
 def readMappingFile(filename):
-    values = defaultdict(list)
+    return loaders.read_mapping(filename, list)
+
+def iterMappingFile(filename):
+    """Streams (key, values) rows of a mapping file without loading it."""
+    if binary_format.is_binary(filename):
+        yield from binary_format.Mapping(filename).rows()
+        return
     with open(filename, 'r') as mappingFile:
         for line in mappingFile:
-            sl = line.strip().split()
-            values[sl[0]] = sl[1:]
-    return values
+            sl = line.split()
+            if sl:
+                yield sl[0], sl[1:]
 
-def mim2mesh(mim2pubmed, pubmed2mesh, outfile):
-    with open(outfile,'w') as f:
-        for mimno in track(mim2pubmed, description="Converting MIM to MeSH..."):
-            line = [mimno]
-            for pubmed in mim2pubmed[mimno]:
-                line.extend(pubmed2mesh[pubmed])
-            if len(line) > 1:
-                f.write('\t'.join(line))
-                f.write('\n')
+def formatLine(mimno, descriptors, weights):
+    if weights:
+        fields = [desc + ':' + str(count) for desc, count in descriptors.items()]
+    else:
+        fields = list(descriptors)
+    return mimno + '\t' + '\t'.join(fields) + '\n'
+
+def writeChunked(lines, outfile):
+    chunk = []
+    with open(outfile, 'w', buffering=WRITE_BUFFER) as f:
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= CHUNK_LINES:
+                f.writelines(chunk)
+                chunk = []
+        f.writelines(chunk)
+
+def writeBinary(joined, outfile, weights):
+    writer = binary_format.MappingWriter(outfile, weighted=weights)
+    for mimno, descriptors in joined:
+        writer.add(mimno, list(descriptors), list(descriptors.values()) if weights else None)
+    writer.close()
+
+def joinStreamingMim2Pubmed(mim2pubmed_file, pubmed2mesh):
+    """
+    Probe side is mim2pubmed: each MIM line is complete, so it can be
+    joined and written straight away.
+    """
+    for mimno, pubmeds in iterMappingFile(mim2pubmed_file):
+        descriptors = Counter()
+        for pubmed in pubmeds:
+            descriptors.update(pubmed2mesh.get(pubmed, ()))
+        if descriptors:
+            yield mimno, descriptors
+
+def joinStreamingPubmed2Mesh(mim2pubmed, pubmed2mesh_file):
+    """
+    Probe side is pubmed2mesh: the (smaller) mim2pubmed mapping is inverted
+    and every publication adds its descriptors to the MIM numbers citing it.
+    """
+    pubmed2mim = defaultdict(list)
+    for mimno, pubmeds in mim2pubmed.items():
+        for pubmed in pubmeds:
+            pubmed2mim[pubmed].append(mimno)
+    mim2mesh = {mimno: Counter() for mimno in mim2pubmed}
+    for pubmed, descriptors in iterMappingFile(pubmed2mesh_file):
+        for mimno in pubmed2mim.get(pubmed, ()):
+            mim2mesh[mimno].update(descriptors)
+    for mimno, descriptors in mim2mesh.items():
+        if descriptors:
+            yield mimno, descriptors
+
+def mim2mesh(mim2pubmed_file, pubmed2mesh_file, outfile, weights=False, build_side='auto'):
+    if build_side == 'auto':
+        #keep the smaller file in memory.
+        if binary_format.size(pubmed2mesh_file) <= binary_format.size(mim2pubmed_file):
+            build_side = 'pubmed2mesh'
+        else:
+            build_side = 'mim2pubmed'
+    print('Loading ' + build_side + ' in memory..')
+    if build_side == 'pubmed2mesh':
+        joined = joinStreamingMim2Pubmed(mim2pubmed_file, readMappingFile(pubmed2mesh_file))
+    else:
+        joined = joinStreamingPubmed2Mesh(readMappingFile(mim2pubmed_file), pubmed2mesh_file)
+    if binary_format.wants_binary(outfile):
+        writeBinary(track(joined, description="Converting MIM to MeSH..."), outfile, weights)
+        return
+    lines = (formatLine(mimno, descriptors, weights) for mimno, descriptors in joined)
+    writeChunked(track(lines, description="Converting MIM to MeSH..."), outfile)
 
 
 if __name__ == '__main__':
-    
-    #check the parameters.
-    if len(sys.argv[1:]) < 3:
-        print("--------------------------------------------------------------------------------------------------------------")
-        print("Maps each OMIM record to the MeSH terms of its associated publication")
-        print("Usage:")
-        print("======")
-        print("python MIM2MeSH.py mim2pubmed pubmed2mesh outputfile")
-        print("Where:")
-        print("mim2pubmed: Mapping between OMIM records and the PubMed identifiers of the referenced literature ")
-        print("\t*mim\\tpubmedid\\t...\\tpubmedid")
-        print("pubmed2mesh: Mapping between PubMed records and their MeSH terms")
-        print("\t*pubmedid\\tmeshDescriptorUniqueId\\t...\\tmeshDescriptorUniqueId")
-        print("outputfile: Desired output file name")
-        print("--------------------------------------------------------------------------------------------------------------")
-        exit()
-    #------------------
-
-    #read the first file.
-    mim2pubmed = readMappingFile(sys.argv[1])
-    #read the second file.
-    pubmed2mesh = readMappingFile(sys.argv[2])
-    #produce the mapping
-    mim2mesh(mim2pubmed, pubmed2mesh, sys.argv[3])
+    import argparse
+
+    aparser = argparse.ArgumentParser(description="Maps each OMIM record to the MeSH terms of its associated publications")
+    aparser.add_argument("mim2pubmed",
+                         help="Mapping between OMIM records and the PubMed identifiers of the referenced literature: "
+                              "mim\\tpubmedid\\t...\\tpubmedid")
+    aparser.add_argument("pubmed2mesh",
+                         help="Mapping between PubMed records and their MeSH terms: "
+                              "pubmedid\\tmeshDescriptorUniqueId\\t...\\tmeshDescriptorUniqueId")
+    aparser.add_argument("outputfile", help="Desired output file name (binary mapping if it ends in .npd)")
+    aparser.add_argument("--weights", action="store_true",
+                         help="write descriptor:count, where count is the number of publications of the "
+                              "MIM record annotated with the descriptor")
+    aparser.add_argument("--build-side", choices=['auto', 'pubmed2mesh', 'mim2pubmed'], default='auto',
+                         help="mapping kept in memory, the other one is streamed (default: the smaller file)")
+    args = aparser.parse_args()
+    mim2mesh(args.mim2pubmed, args.pubmed2mesh, args.outputfile, args.weights, args.build_side)
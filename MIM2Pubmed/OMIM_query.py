@@ -25,43 +25,66 @@ __license__ = "GPL"
 __version__ = "3"
 
 
-import xml.dom.minidom
+import xml.etree.ElementTree as ET
 import configparser
 import urllib.request
 from itertools import islice
 from collections import defaultdict
 import datetime,time
 import sys,traceback
-
-def handleDOM(referenceList,filename):
-    mapping = defaultdict(list)
-    for reference in referenceList.getElementsByTagName("reference"):
-        currentMapping = handleReference(reference)
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import binary_format
+
+#size of the chunks read from each API response, and of the output buffer.
+READ_CHUNK = 64 * 1024
+WRITE_BUFFER = 1024 * 1024
+
+def iterReferences(stream):
+    """
+    Incrementally parses a referenceList response, yielding (mimNumber, pubmedID)
+    pairs as soon as each <reference> element is closed. References without
+    a pubmed id are skipped.
+    """
+    pullParser = ET.XMLPullParser(events=('end',))
+    while True:
+        chunk = stream.read(READ_CHUNK)
+        if not chunk:
+            break
+        pullParser.feed(chunk)
+        for pair in handleEvents(pullParser):
+            yield pair
+    pullParser.close()
+    for pair in handleEvents(pullParser):
+        yield pair
+
+def handleEvents(pullParser):
+    for _, element in pullParser.read_events():
+        if element.tag != 'reference':
+            continue
+        currentMapping = handleReference(element)
+        #the subtree is no longer needed, release it.
+        element.clear()
         if currentMapping:
-            mapping[currentMapping[0]].append(currentMapping[1])
-    outfile = open(filename,'a')
-    for mim,pmed in mapping.items():
-        outfile.write(mim+"\t")
-        outfile.write('\t'.join(pmed))
-        outfile.write("\n")
-    outfile.close()
+            yield currentMapping
 
 def handleReference(reference):
-    pubmed = reference.getElementsByTagName("pubmedID")
-    mimNumber = reference.getElementsByTagName("mimNumber")
+    pubmed = reference.findtext('.//pubmedID')
+    mimNumber = reference.findtext('.//mimNumber')
     #if the pubmed id was not found, we just skip it.
-    try:
-        return (mimNumber[0].firstChild.data, pubmed[0].firstChild.data)
-    except:
-        pass
-
-
-def getText(nodelist):
-    rc = []
-    for node in nodelist:
-        if node.nodeType == node.TEXT_NODE:
-            rc.append(node.data)
-    return rc
+    if pubmed and mimNumber:
+        return (mimNumber.strip(), pubmed.strip())
+
+def handleResponse(stream, outfile):
+    """
+    Writes the references of a single response to the (already open) outfile,
+    one line per MIM number: mim\tpubmed\t...\tpubmed
+    """
+    mapping = defaultdict(list)
+    for mim, pmed in iterReferences(stream):
+        mapping[mim].append(pmed)
+    for mim, pmed in mapping.items():
+        outfile.write(mim + "\t" + '\t'.join(pmed) + "\n")
 
 """
 The API will limit how many entries can be retrieved in a single request.
@@ -70,6 +93,51 @@ Gene map entries are limited to 100 per request.
 We add some throttling of our own, just to be nice and make sure we don't get banned.
 """
 
+def readJournal(journal_file):
+    """
+    Reads the progress journal of a previous crawl. Each line records the
+    outcome of one batch of MIM numbers:
+        done\tmim\tmim...
+        failed\tmim\tmim...
+    Returns the set of MIM numbers whose batch completed. MIM numbers that
+    only appear in failed batches are not considered done, so they are retried.
+    """
+    completed = set()
+    if not os.path.isfile(journal_file):
+        return completed
+    with open(journal_file, 'r') as f:
+        for line in f:
+            sl = line.strip().split('\t')
+            if sl[0] == 'done':
+                completed.update(sl[1:])
+    return completed
+
+def journalBatch(journal, status, mims):
+    journal.write(status + '\t' + '\t'.join(mims) + '\n')
+    journal.flush()
+    os.fsync(journal.fileno())
+
+def mergeOutput(filename):
+    """
+    Rewrites the output file so that each MIM number appears in a single line,
+    with its PubMed identifiers deduplicated (first seen order is kept). Lines
+    duplicated by an interrupted crawl are merged here.
+    """
+    if not os.path.isfile(filename):
+        return
+    mapping = defaultdict(dict)
+    with open(filename, 'r') as f:
+        for line in f:
+            sl = line.strip().split('\t')
+            if len(sl) < 2:
+                continue
+            mapping[sl[0]].update(dict.fromkeys(sl[1:]))
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w', buffering=WRITE_BUFFER) as out:
+        for mim, pmed in mapping.items():
+            out.write(mim + "\t" + '\t'.join(pmed) + "\n")
+    os.replace(tmp_file, filename)
+
 def fetchData(phenotype_list, outfile, config_file):
     #read the cnf file.
     parser = configparser.ConfigParser()
@@ -79,15 +147,25 @@ def fetchData(phenotype_list, outfile, config_file):
         server = parser.get('APIconfig','server')
         time_limit = parser.get('Throttling', 'time')
         req_number = parser.get('Throttling', 'req_number')
+        retries = parser.getint('Throttling', 'retries', fallback=2)
     except:
         print('There is a problem with the configuration file. Please refer to the supplementary material for the appropriate format')
         print('Program will now terminate')
         exit()
 
-    with open(phenotype_list, 'r') as infile:
+    #the journal records which batches were completed, so an interrupted crawl can be resumed.
+    journal_file = outfile + '.journal'
+    #a binary output is imported from the text file of the crawl, kept to resume it.
+    crawl_file = outfile + '.tsv' if binary_format.wants_binary(outfile) else outfile
+    completed = readJournal(journal_file)
+    if completed:
+        print('Resuming crawl: ' + str(len(completed)) + ' MIM numbers already done')
+
+    failed_batches = 0
+    with open(phenotype_list, 'r') as infile, open(crawl_file, 'a', buffering=WRITE_BUFFER) as out, open(journal_file, 'a') as journal:
 
-        #read the lines.
-        lines = infile.readlines()
+        #read the lines, skipping the MIM numbers that were already fetched.
+        lines = [i.strip() for i in infile if i.strip() and i.strip() not in completed]
 
         current_request_number = False
         current_line = 0
@@ -97,28 +175,33 @@ def fetchData(phenotype_list, outfile, config_file):
 
         while (True):
             current_query = 'https://'+server+'/api/entry/referenceList?'
-            try:
-                selected_lines = lines[current_line : current_line + int(req_number)]
-            except:
-                selected_lines = lines[current_line:]
+            selected_lines = lines[current_line : current_line + int(req_number)]
             current_line += int(req_number)
 
             #construct the parameters
-            line = ['mimNumber='+ i.strip() + '&' for i in selected_lines]
+            line = ['mimNumber='+ i + '&' for i in selected_lines]
             #check if not emtpy (for the last line) and then end.
             if not line:
                 break;
 
             current_query = current_query + ''.join(line) + 'apiKey='+api_key
-            try:
-                response = urllib.request.urlopen(current_query)
-                dom = xml.dom.minidom.parseString(response.read())
-                handleDOM(dom, outfile)
-            except:
-                print('The query ' + current_query + ' could not be completed. Full traceback follows')
-                exc_type, exc_value, exc_traceback = sys.exc_info()
-                traceback.print_exception(exc_type, exc_value, exc_traceback, limit=2, file=sys.stdout)
-                exit()
+            for attempt in range(retries + 1):
+                try:
+                    with urllib.request.urlopen(current_query) as response:
+                        handleResponse(response, out)
+                    #make sure the records are on disk before marking the batch as done.
+                    out.flush()
+                    os.fsync(out.fileno())
+                    journalBatch(journal, 'done', selected_lines)
+                    break
+                except:
+                    print('The query ' + current_query + ' could not be completed (attempt ' + str(attempt + 1) + '). Full traceback follows')
+                    exc_type, exc_value, exc_traceback = sys.exc_info()
+                    traceback.print_exception(exc_type, exc_value, exc_traceback, limit=2, file=sys.stdout)
+                    time.sleep(float(time_limit) * (attempt + 1))
+            else:
+                journalBatch(journal, 'failed', selected_lines)
+                failed_batches += 1
 
             #throttle. 
             if current_request_number:
@@ -128,14 +211,27 @@ def fetchData(phenotype_list, outfile, config_file):
             else:
                 current_request_number = True
 
+    print('Merging output..')
+    mergeOutput(crawl_file)
+    #a partial crawl is not an output: fail, so the pipeline runs the stage again.
+    if failed_batches:
+        print(str(failed_batches) + ' batches failed. Run the same command again to retry them.')
+        sys.exit(1)
+    if crawl_file != outfile:
+        binary_format.import_mapping(crawl_file, outfile, weighted=False)
+
 help_string = """
         Extracts the PubMed identifiers from records in OMIM
         Usage:
         ======
         python OMIM_query.py omim_list_file omim2pubmed_outfile config_file
         \t* omim_list_infile: is a list of the mim numbers to consider.
-        \t* omim2pubmed_outfile: output file name
+        \t* omim2pubmed_outfile: output file name. If it ends in .npd the mapping is written in binary form
+        \t  (Common/binary_format.py) and the crawl is kept in omim2pubmed_outfile.tsv.
         \t* config_file: is the path for the configuration file with the API details. If left blank ./api_key will be read.
+        Progress is recorded in omim2pubmed_outfile.journal; running the same command again after
+        an interruption skips the completed batches and retries the failed ones. If batches still
+        fail after the retries, the exit status is 1 (and a .npd output is not written).
         ---------------------------------------------------------------------------------------------------------------
         """
 
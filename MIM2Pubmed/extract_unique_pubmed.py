@@ -4,16 +4,24 @@ The output of that script is a mapping with the folowing format:
 
     OMIM ID\tPubMed ID\tPubMed ID\t...
 
-This script simply collects all pubmeds and writes a file with unique PubMed IDs
+This script simply collects all pubmeds and writes a file with unique PubMed IDs.
+The mapping can also be a binary mapping (Common/binary_format.py).
 """
 
+import os
+import sys
 import rich.progress
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import binary_format
 
 def run(mapping_file, outfile):
     pubmeds = set()
-    with rich.progress.open(mapping_file, "r", description="Reading mapping file...") as f:
-        for line in f:
-            pubmeds |= set(line.strip().split("\t")[1:])
+    if binary_format.is_binary(mapping_file):
+        pubmeds = set(binary_format.Mapping(mapping_file).pairs()[1])
+    else:
+        with rich.progress.open(mapping_file, "r", description="Reading mapping file...") as f:
+            for line in f:
+                pubmeds |= set(line.strip().split("\t")[1:])
     with open(outfile, "w") as o:
         for pubmed in rich.progress.track(pubmeds, description="Writing unique PubMed IDs..."):
             o.write(f"{pubmed}\n")
@@ -24,7 +32,7 @@ if __name__ == "__main__":
     aparser = argparse.ArgumentParser()
     required_arguments = aparser.add_argument_group("required arguments")
     required_arguments.add_argument("--omim-to-pubmed", "--in",
-                                    help="OMIM2PubMed mapping file",
+                                    help="OMIM2PubMed mapping file (TSV or binary)",
                                     required=True)
     required_arguments.add_argument("--outfile", "--o",
                                     help="path to the output file", 
@@ -0,0 +1,378 @@
+"""
+    Runs the disease similarity pipeline end to end.
+    Copyright (C) 2015 Horacio Caniza
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+__author__  = "Horacio Caniza"
+__email__   = "h.j.canizavierci@cs.rhul.ac.uk"
+__copyright__ = "Copyright (C) 2015 Horacio Caniza"
+__license__ = "GPL"
+__version__ = "3"
+
+"""
+Each script of the pipeline is modelled as a Stage with declared input and
+output files. Dependencies between stages are derived from these files (a
+stage depends on the stages producing its inputs), so the stages form a DAG.
+
+A stage is skipped when its signature (a hash of its command and of the
+contents of its inputs) matches the one recorded on its last successful run
+and all its outputs exist. Stages whose dependencies are satisfied run in
+parallel, e.g. the different measures and benchmarks.
+"""
+
+import configparser
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+sys.path.insert(0, os.path.join(ROOT, 'Common'))
+import binary_format
+PYTHON = sys.executable
+
+CATEGORIES = ['A','B','C','D','E','F','G','H','I','J','K','L','M','N','V','Z']
+
+
+def script(*path):
+    return os.path.join(ROOT, *path)
+
+
+class Stage(object):
+    """
+    A step of the pipeline. Either `command` (a list of arguments, run as a
+    subprocess in `cwd`) or `action` (a python callable) must be given.
+    When `clean` is set, the outputs are removed before the stage runs; stages
+    that append to their outputs and know how to resume (OMIM_query) keep them.
+    `directories` are created before running (e.g. Cache/ for the similarity scripts).
+    """
+    def __init__(self, name, inputs, outputs, command=None, action=None, cwd=None, clean=True, directories=()):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.command = command
+        self.action = action
+        self.cwd = cwd
+        self.clean = clean
+        self.directories = list(directories)
+
+    def description(self):
+        if self.command:
+            return ' '.join(self.command)
+        return self.action.__name__
+
+    def run(self):
+        if self.clean:
+            for output in self.outputs:
+                if os.path.isfile(output):
+                    os.remove(output)
+                elif binary_format.is_binary(output):
+                    shutil.rmtree(output)
+        for directory in [os.path.dirname(o) for o in self.outputs] + self.directories:
+            os.makedirs(directory, exist_ok=True)
+        if self.command:
+            subprocess.run(self.command, cwd=self.cwd, check=True)
+        else:
+            self.action(self.inputs, self.outputs)
+        missing = [o for o in self.outputs if not os.path.exists(o)]
+        if missing:
+            raise RuntimeError('stage ' + self.name + ' did not produce ' + ', '.join(missing))
+
+
+class Pipeline(object):
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.stages = dict()
+        self.producers = dict()
+        self.state_file = os.path.join(workdir, '.pipeline_state.json')
+        self.state = dict()
+        if os.path.isfile(self.state_file):
+            with open(self.state_file, 'r') as f:
+                self.state = json.load(f)
+        #content hashes, keyed by (path, size, mtime), so unchanged files are hashed once.
+        self.__hashes = dict()
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise ValueError('duplicated stage ' + stage.name)
+        for output in stage.outputs:
+            if output in self.producers:
+                raise ValueError(output + ' is produced by ' + self.producers[output] + ' and ' + stage.name)
+            self.producers[output] = stage.name
+        self.stages[stage.name] = stage
+
+    def dependencies(self, name):
+        return set(self.producers[i] for i in self.stages[name].inputs if i in self.producers)
+
+    def topological_order(self):
+        order = []
+        visited = dict()
+        def visit(name):
+            if visited.get(name) == 'done':
+                return
+            if visited.get(name) == 'visiting':
+                raise ValueError('the pipeline has a cycle through ' + name)
+            visited[name] = 'visiting'
+            for dep in sorted(self.dependencies(name)):
+                visit(dep)
+            visited[name] = 'done'
+            order.append(name)
+        for name in sorted(self.stages):
+            visit(name)
+        return order
+
+    def file_hash(self, filename):
+        if os.path.isdir(filename):
+            h = hashlib.sha256()
+            for entry in sorted(os.listdir(filename)):
+                h.update(entry.encode())
+                h.update(self.file_hash(os.path.join(filename, entry)).encode())
+            return h.hexdigest()
+        st = os.stat(filename)
+        key = (filename, st.st_size, st.st_mtime_ns)
+        if key not in self.__hashes:
+            h = hashlib.sha256()
+            with open(filename, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(block)
+            self.__hashes[key] = h.hexdigest()
+        return self.__hashes[key]
+
+    def signature(self, stage):
+        h = hashlib.sha256(stage.description().encode())
+        for filename in stage.inputs:
+            h.update(filename.encode())
+            h.update(self.file_hash(filename).encode())
+        return h.hexdigest()
+
+    def up_to_date(self, stage):
+        if not all(os.path.exists(o) for o in stage.outputs):
+            return False
+        return self.state.get(stage.name) == self.signature(stage)
+
+    def save_state(self):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.state_file)
+
+    def run(self, jobs=1, force=(), dry_run=False):
+        order = self.topological_order()
+        pending = list(order)
+        finished = set()
+        failed = set()
+        running = dict()
+        #only used by dry runs: stages that would run, their dependents would run too.
+        outdated = set()
+        os.makedirs(self.workdir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while pending or running:
+                for name in list(pending):
+                    deps = self.dependencies(name)
+                    if deps & failed:
+                        print('[skip] ' + name + ' (a dependency failed)')
+                        failed.add(name)
+                        pending.remove(name)
+                        continue
+                    if not deps <= finished or len(running) >= jobs:
+                        continue
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    inputs_exist = all(os.path.exists(i) for i in stage.inputs)
+                    if name not in force and not (deps & outdated) and inputs_exist and self.up_to_date(stage):
+                        print('[cached] ' + name)
+                        finished.add(name)
+                        continue
+                    if dry_run:
+                        print('[run] ' + name + ': ' + stage.description())
+                        outdated.add(name)
+                        finished.add(name)
+                        continue
+                    if not inputs_exist:
+                        print('[fail] ' + name + ': missing input ' + ', '.join(i for i in stage.inputs if not os.path.exists(i)))
+                        failed.add(name)
+                        continue
+                    print('[run] ' + name)
+                    running[executor.submit(self.__run_stage, stage)] = name
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        (signature, elapsed) = future.result()
+                    except Exception as e:
+                        print('[fail] ' + name + ': ' + str(e))
+                        failed.add(name)
+                        continue
+                    print('[done] ' + name + ' (%.1fs)' % elapsed)
+                    self.state[name] = signature
+                    self.save_state()
+                    finished.add(name)
+        return not failed
+
+    def __run_stage(self, stage):
+        start = time.time()
+        stage.run()
+        return (self.signature(stage), time.time() - start)
+
+
+#-----------------------------
+def translate_mesh_ids(inputs, outputs):
+    """
+    elink returns the NCBI MeSH uids (68xxxxxx), translate them into
+    descriptor unique ids (Dxxxxxx). See PubMed2MeSH/README.
+    """
+    with open(inputs[0], 'r') as f, binary_format.open_output(outputs[0], weighted=False) as out:
+        for line in f:
+            sl = line.split()
+            out.write('\t'.join([sl[0]] + ['D' + i[2:] if i.startswith('68') else i for i in sl[1:]]) + '\n')
+
+
+def build_pipeline(config_file):
+    parser = configparser.ConfigParser()
+    parser.read(config_file)
+    base = os.path.dirname(os.path.abspath(config_file))
+    def path(section, option, fallback=None):
+        value = parser.get(section, option, fallback=fallback)
+        if not value:
+            return value
+        return os.path.normpath(os.path.join(base, value))
+
+    workdir = path('Paths', 'workdir', 'run')
+    pipeline = Pipeline(workdir)
+    work = lambda name: os.path.join(workdir, name)
+    #binary: the mappings and similarity files are written in the form of Common/binary_format.py
+    file_format = parser.get('Paths', 'format', fallback='tsv').strip().lower()
+    if file_format not in ('tsv', 'binary'):
+        raise ValueError('unknown format ' + file_format)
+    os.environ[binary_format.ENVIRONMENT] = file_format
+    mapping_suffix = binary_format.SUFFIX if file_format == 'binary' else '.txt'
+
+    omim_ids = work('omim_ids.txt')
+    mim2pubmed = work('mim2pubmed' + mapping_suffix)
+    unique_pubmed = work('unique_pubmed.txt')
+    pubmed2mesh = work('pubmed2mesh' + mapping_suffix)
+    mim2mesh = work('mim2mesh' + mapping_suffix)
+    descriptors = path('Paths', 'mesh_descriptors')
+
+    pipeline.add(Stage('extract_omim_list', [path('Paths', 'mim_titles')], [omim_ids],
+                       [PYTHON, script('MIM2Pubmed', 'extract_omim_list.py'), '--in', path('Paths', 'mim_titles'), '--o', omim_ids]))
+    pipeline.add(Stage('omim_query', [omim_ids, path('Paths', 'omim_api_config')], [mim2pubmed],
+                       [PYTHON, script('MIM2Pubmed', 'OMIM_query.py'), omim_ids, mim2pubmed, path('Paths', 'omim_api_config')],
+                       clean=False))
+    pipeline.add(Stage('extract_unique_pubmed', [mim2pubmed], [unique_pubmed],
+                       [PYTHON, script('MIM2Pubmed', 'extract_unique_pubmed.py'), '--in', mim2pubmed, '--o', unique_pubmed]))
+
+    major_topics = parser.getboolean('PubMed', 'major_topics', fallback=True)
+    mesh_names = path('PubMed', 'mesh_names', '')
+    query_inputs = [unique_pubmed, path('Paths', 'entrez_config')] + ([] if major_topics else [mesh_names])
+    if major_topics:
+        pubmed2mesh_uids = work('pubmed2mesh_uids.txt')
+        pipeline.add(Stage('pubmed_query', query_inputs, [pubmed2mesh_uids],
+                           [PYTHON, script('PubMed2MeSH', 'PubMed_query_new.py'), unique_pubmed, 'YES', 'none',
+                            pubmed2mesh_uids, path('Paths', 'entrez_config')]))
+        pipeline.add(Stage('translate_mesh_ids', [pubmed2mesh_uids], [pubmed2mesh], action=translate_mesh_ids))
+    else:
+        pipeline.add(Stage('pubmed_query', query_inputs, [pubmed2mesh],
+                           [PYTHON, script('PubMed2MeSH', 'PubMed_query_new.py'), unique_pubmed, 'NO', mesh_names,
+                            pubmed2mesh, path('Paths', 'entrez_config')]))
+    pipeline.add(Stage('mim2mesh', [mim2pubmed, pubmed2mesh], [mim2mesh],
+                       [PYTHON, script('MIM2MeSH', 'MIM2MESH.py'), mim2pubmed, pubmed2mesh, mim2mesh]))
+
+    #similarities: every measure runs in its own directory (Cache/ and localStore/ are relative to it)
+    measures = [m.strip().upper() for m in parser.get('Similarity', 'measures', fallback='Resnik').split(',') if m.strip()]
+    subsets = [s.strip().upper() for s in parser.get('Similarity', 'subsets', fallback='').split(',') if s.strip()]
+    per_category = parser.getboolean('Similarity', 'per_category', fallback=False)
+    ism = 'yes' if parser.getboolean('Similarity', 'ism', fallback=False) else 'no'
+    tile_size = parser.getint('Similarity', 'tile_size', fallback=0)
+    tiled = ['--tile-size', str(tile_size)] if tile_size else []
+    if parser.getboolean('Similarity', 'packed', fallback=False):
+        tiled.append('--packed')
+    if parser.getboolean('Similarity', 'float32', fallback=False):
+        tiled.append('--float32')
+    similarity_files = []
+    for measure in measures:
+        for subset in subsets:
+            cwd = work(os.path.join('similarity', 'combined_' + subset + '_' + measure))
+            outputs = [os.path.join(cwd, 'localStore', 'combined_similarity-' + subset + '_' + measure + binary_format.output_suffix())]
+            pipeline.add(Stage('combined_' + subset + '_' + measure, [descriptors, mim2mesh], outputs,
+                               [PYTHON, script('ComputeSimilarities', 'compute_combined_similarity.py'),
+                                descriptors, mim2mesh, measure, ism, subset] + tiled,
+                               cwd=cwd, directories=[os.path.join(cwd, 'Cache')]))
+            similarity_files.extend(outputs)
+    if per_category:
+        #a single run of compute_matrices computes all the measures, sharing the IC and MICA.
+        cwd = work(os.path.join('similarity', 'per_category'))
+        outputs = [os.path.join(cwd, 'localStore', cat + '_' + measure + binary_format.output_suffix())
+                   for measure in measures for cat in CATEGORIES]
+        pipeline.add(Stage('per_category', [descriptors, mim2mesh], outputs,
+                           [PYTHON, script('ComputeSimilarities', 'compute_matrices.py'),
+                            descriptors, mim2mesh, ','.join(measures), ism] + tiled,
+                           cwd=cwd, directories=[os.path.join(cwd, 'Cache')]))
+        similarity_files.extend(outputs)
+
+    #benchmarks, only if a ground truth is configured.
+    ground_truth = path('Benchmark', 'ground_truth', '')
+    mimtoprot = path('Benchmark', 'mimtoprot', '')
+    omim_uniprot = path('Benchmark', 'omim_uniprot', '') or mimtoprot
+    modifier = parser.get('Benchmark', 'name', fallback='benchmark')
+    sparse = ['--sparse'] if parser.getboolean('Benchmark', 'sparse', fallback=False) else []
+    if ground_truth and mimtoprot:
+        destination = work('benchmarks') + os.sep
+        filtered = []
+        for similarity_file in similarity_files:
+            name = os.path.basename(similarity_file)
+            if name.endswith(binary_format.SUFFIX):
+                name = name[:-len(binary_format.SUFFIX)]
+            benchmark = destination + name + '_' + modifier
+            pipeline.add(Stage('benchmark_' + name, [ground_truth, similarity_file, mimtoprot], [benchmark],
+                               [PYTHON, script('BuildBenchmark', 'buildBenchmarks.py'), ground_truth, similarity_file,
+                                mimtoprot, destination, modifier] + sparse))
+            pipeline.add(Stage('filter_' + name, [benchmark, omim_uniprot], [benchmark + '-filter'],
+                               [PYTHON, script('BuildBenchmark', 'filterBenchmarks.py'), benchmark, omim_uniprot]))
+            filtered.append(benchmark + '-filter')
+        if parser.getboolean('Benchmark', 'evaluate', fallback=False) and filtered:
+            summary = destination + 'evaluation_' + modifier + '.tsv'
+            options = ['--top-k', ','.join(k.strip() for k in parser.get('Benchmark', 'top_k', fallback='100,1000').split(',')),
+                       '--bins', str(parser.getint('Benchmark', 'bins', fallback=0)),
+                       '--jobs', str(parser.getint('Benchmark', 'evaluate_jobs', fallback=1))]
+            pipeline.add(Stage('evaluate', filtered, [summary],
+                               [PYTHON, script('BuildBenchmark', 'evaluate.py'), summary] + filtered + options))
+    return pipeline
+
+
+if __name__ == "__main__":
+    import argparse
+
+    aparser = argparse.ArgumentParser(description="Runs the pipeline, skipping the stages that are up to date")
+    aparser.add_argument("config", help="pipeline configuration file, see pipeline.example")
+    aparser.add_argument("--jobs", "-j", type=int, default=1,
+                         help="number of stages run in parallel")
+    aparser.add_argument("--force", nargs="*", default=[],
+                         help="stages to run even if they are up to date")
+    aparser.add_argument("--dry-run", action="store_true",
+                         help="only print the stages and their commands")
+    args = aparser.parse_args()
+    pipeline = build_pipeline(args.config)
+    if not pipeline.run(args.jobs, set(args.force), args.dry_run):
+        sys.exit(-1)
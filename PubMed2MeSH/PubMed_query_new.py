@@ -35,6 +35,10 @@ import sys,traceback
 from rich.progress import Progress
 
 from Bio import Entrez
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import loaders
+import binary_format
 
 
 class queryPubmed(object):
@@ -67,32 +71,32 @@ class queryPubmed(object):
             steps = 1
         #------------------------
         print("Processing " + str(num_lines) + " records")
-        outfile = open(self.__pubmedToMeshOutfile,'w')
         Entrez.email = config_email
         if self.__majorTopicsOnly:
             print('Getting only major topics')
 
-        with open(self.__pubmedInputFilename, 'r') as infile:
-            with Progress() as progress:
-                task = progress.add_task(total=steps + 1, description="Querying PubMed...")
-                while (True):
-                    pubmed_ids = [i for i in list(islice(infile, 10))]
-                    if not pubmed_ids:
-                        break;
-                    if (self.__majorTopicsOnly):
-                        #this requires a list
-                        allSets = self.getMajorTopics(pubmed_ids)
-                    else:
-                        #this requires a comma separated string.
-                        allSets = self.getAllMeSHTerms(','.join(pubmed_ids))
-
-                    if len(allSets) > 0:
-                        for line in  allSets:
-                            if len(line) > 1:
-                                outfile.write('\t'.join(line))
-                                outfile.write('\n')
-                    progress.advance(task)
-        outfile.close()
+        #a binary pubmed2mesh (.npd) is imported from the lines once they are all written.
+        with binary_format.open_output(self.__pubmedToMeshOutfile, weighted=False) as outfile:
+            with open(self.__pubmedInputFilename, 'r') as infile:
+                with Progress() as progress:
+                    task = progress.add_task(total=steps + 1, description="Querying PubMed...")
+                    while (True):
+                        pubmed_ids = [i for i in list(islice(infile, 10))]
+                        if not pubmed_ids:
+                            break;
+                        if (self.__majorTopicsOnly):
+                            #this requires a list
+                            allSets = self.getMajorTopics(pubmed_ids)
+                        else:
+                            #this requires a comma separated string.
+                            allSets = self.getAllMeSHTerms(','.join(pubmed_ids))
+
+                        if len(allSets) > 0:
+                            for line in  allSets:
+                                if len(line) > 1:
+                                    outfile.write('\t'.join(line))
+                                    outfile.write('\n')
+                        progress.advance(task)
 
     """This function produces lines reading the entire set of pubmed ids"""
     def getAllMeSHTerms(self, pubmed_ids):
@@ -168,13 +172,7 @@ class queryPubmed(object):
 
 #-----------------------------
 def readMappingFile(infile):
-    mapping = defaultdict()
-    with open(infile,'r') as f:
-        for line in f:
-            sl = line.strip().split('\t')
-            mapping[sl[0]] = sl[1]
-
-    return mapping
+    return loaders.read_dict(infile, '\t')
 
 
 help_string = """
@@ -186,7 +184,7 @@ help_string = """
         \t* pubmed_list: single column file containing the desired PubMed ids.
         \t* majorTopicsOnly: string (Yes/No). Determines whether we get only the major topics (see Supplementary material).
         \t* mappingFile: Double column file, mapping MeSh term names (e.g. Adult) to their unique descriptor identifier (e.g. D000328).
-        \t* pubmed2mesh_outfile: writable file where the mappings will be placed.
+        \t* pubmed2mesh_outfile: writable file where the mappings will be placed (binary mapping if it ends in .npd).
         \t* config_file: is the path for the configuration file with the API details. If left blank ./entrez_config will be read.
         ---------------------------------------------------------------------------------------------------------------
         """
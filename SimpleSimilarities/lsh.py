@@ -0,0 +1,126 @@
+"""
+    Approximate Jaccard similarity with MinHash and LSH
+    Copyright (C) 2015 Horacio Caniza
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+__author__  = "Horacio Caniza"
+__email__   = "h.j.canizavierci@cs.rhul.ac.uk"
+__copyright__ = "Copyright (C) 2015 Horacio Caniza"
+__license__ = "GPL"
+__version__ = "3"
+
+"""
+Finds the pairs of diseases whose Jaccard similarity is (likely) above a
+threshold without comparing all the pairs:
+
+    1. every disease gets a MinHash signature, num_perm minimum hash values
+       of its terms. Two signatures agree in a position with probability
+       equal to the Jaccard index of the two sets.
+    2. signatures are cut in `bands` bands; diseases with an identical band
+       fall in the same bucket and become candidate pairs. A pair with
+       Jaccard index s is a candidate with probability 1 - (1 - s^r)^b.
+    3. candidates are scored with the estimated (signature agreement) or the
+       exact Jaccard index, and those below the threshold are dropped.
+"""
+
+import numpy as np
+
+#hashes are (a*x + b) mod p, with p = 2^31 - 1 (the products fit in 64 bits)
+PRIME = (1 << 31) - 1
+#number of hash functions evaluated at once, bounds the memory to PERM_CHUNK x nnz
+PERM_CHUNK = 16
+
+
+def minhash_signatures(X, num_perm=128, seed=0):
+    """
+    MinHash signatures (rows x num_perm) of the rows of the sparse binary
+    matrix X. Every row must have at least one term.
+    """
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, PRIME, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, PRIME, size=num_perm).astype(np.uint64)
+    terms = X.indices.astype(np.uint64)
+    starts = X.indptr[:-1]
+    signatures = np.empty((X.shape[0], num_perm), dtype=np.uint32)
+    for start in range(0, num_perm, PERM_CHUNK):
+        end = min(start + PERM_CHUNK, num_perm)
+        hashes = (a[start:end, None] * terms[None, :] + b[start:end, None]) % PRIME
+        signatures[:, start:end] = np.minimum.reduceat(hashes, starts, axis=1).T
+    return signatures
+
+
+def choose_bands(threshold, num_perm):
+    """
+    Chooses the number of bands b (with r = num_perm / b rows each) whose
+    S-curve midpoint, (1/b)^(1/r), is the closest below the threshold, which
+    favours recall over precision.
+    """
+    best = 1
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        midpoint = (1.0 / bands) ** (1.0 / (num_perm // bands))
+        if midpoint <= threshold:
+            return bands
+        best = bands
+    return best
+
+
+def candidate_pairs(signatures, bands):
+    """
+    Returns the candidate pairs (i, j), i < j, sharing at least one band,
+    as two arrays sorted by i, then j.
+    """
+    n, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    keys = []
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        #identical bands get the same bucket.
+        _, buckets = np.unique(block.view(np.dtype((np.void, block.dtype.itemsize * rows_per_band))).ravel(), return_inverse=True)
+        order = np.argsort(buckets, kind='stable')
+        sorted_buckets = buckets[order]
+        boundaries = np.flatnonzero(np.diff(sorted_buckets)) + 1
+        for members in np.split(order, boundaries):
+            if len(members) < 2:
+                continue
+            members = np.sort(members)
+            i, j = np.triu_indices(len(members), k=1)
+            keys.append(members[i].astype(np.int64) * n + members[j])
+    if not keys:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    keys = np.unique(np.concatenate(keys))
+    return keys // n, keys % n
+
+
+def lsh_jaccard(X, threshold, num_perm=128, bands=None, exact=None, seed=0):
+    """
+    Approximate all pairs Jaccard similarity of the rows of X above a
+    threshold. If `exact` is given, a function (i, j) -> Jaccard index,
+    candidates are re-scored with it; otherwise the MinHash estimate is used.
+    Returns (rows, cols, similarity).
+    """
+    if bands is None:
+        bands = choose_bands(threshold, num_perm)
+    signatures = minhash_signatures(X, num_perm, seed)
+    rows, cols = candidate_pairs(signatures, bands)
+    if exact is not None:
+        similarity = np.array([exact(i, j) for i, j in zip(rows, cols)], dtype=float)
+    else:
+        similarity = np.mean(signatures[rows] == signatures[cols], axis=1)
+    keep = similarity >= threshold
+    return rows[keep], cols[keep], similarity[keep]
@@ -26,28 +26,106 @@ __version__ = "3"
 
 
 from collections import defaultdict
-import itertools as it
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import sys
+import time
+import numpy as np
+import scipy.sparse
 from rich.progress import track
+import os
+import lsh
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Common'))
+import loaders
 
 #descriptor-tree positions file
 def readTreePositions(filename):
     node_coord = defaultdict(list)
-    with open(filename,'r') as f:
-        for line in f:
-            sl = line.strip().split()
-            node_coord[sl[0]] = set([i.strip().split('.')[0][0] for i in sl[1::]])
+    for (descriptor, positions) in loaders.read_rows(filename):
+        node_coord[descriptor] = set([i.split('.')[0][0] for i in positions])
     return node_coord
 
-#mim2mesh
+#mim2mesh, weighted files (descriptor:count) are accepted.
 def read_mapping(filename):
-    d = defaultdict(set)
-    with open (filename, "r") as f:
-        for line in f:
-            sl = line.strip().split()
-            d[sl[0]] = set(sl[1:])
+    return loaders.read_mapping(filename, set, strip_weights=True)
+
+def read_mapping_weighted(filename):
+    """
+    Reads a mapping keeping the multiplicity of each descriptor, i.e. the
+    number of publications of the disease annotated with it. This is either
+    given explicitly (descriptor:count, MIM2MESH.py --weights) or by repeated
+    descriptors. Each disease maps to a list where a descriptor appears as
+    many times as its multiplicity.
+    """
+    d = defaultdict(list)
+    for (mim, fields) in loaders.read_rows(filename):
+        for field in fields:
+            (desc, _, count) = field.partition(':')
+            d[mim].extend([desc] * (int(count) if count else 1))
     return d
 
+available_ontologies = dict([
+    ('A','Anatomy'), ('B','Organisms'),
+    ('C','Diseases'), ('D','Chemicals and Drugs'),
+    ('E','Analytical, Diagnostic and Therapeutic Techniques and Equipment'),
+    ('F','Psychiatry and Psychology'),
+    ('G','Phenomena and Processes'),
+    ('H','Disciplines and Occupations'),
+    ('I','Anthropology, Education, Sociology and Social Phenomena'),
+    ('J','Technology, Industry, Agriculture'),
+    ('K','Humanities'),
+    ('L','Information Science'), ('M','Named Groups'),
+    ('N','Health Care'), ('Z','Geographicals')
+])
+
+#sets of ontologies combined into a single annotation.
+combined_ontologies = dict([
+    ('5categories', ['A','C','D','E','G']),
+    ('combinedCategories', ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'Z'])
+])
+
+def categoryBitmasks(tree_positions, categories):
+    """
+    Encodes the categories of each descriptor as a bitmask, where bit i
+    is set if the descriptor belongs to categories[i].
+    """
+    bits = dict((cat, 1 << i) for i, cat in enumerate(categories))
+    masks = dict()
+    for desc, cats in tree_positions.items():
+        mask = 0
+        for cat in cats:
+            mask |= bits.get(cat, 0)
+        if mask:
+            masks[desc] = mask
+    return masks
+
+def partitionAnnotation(mapping, tree_positions, groups):
+    """
+    Filters the mapping for every group of ontologies in a single pass.
+    `groups` maps a name to a list of ontologies, the result maps the same
+    names to the filtered mapping (as filterAnnotation would produce it).
+    """
+    categories = sorted(set(cat for group in groups.values() for cat in group))
+    masks = categoryBitmasks(tree_positions, categories)
+    bits = dict((cat, 1 << i) for i, cat in enumerate(categories))
+    group_masks = dict()
+    for name, group in groups.items():
+        group_masks[name] = 0
+        for cat in group:
+            group_masks[name] |= bits[cat]
+    #groups selected by each distinct descriptor mask, computed once per mask.
+    selected = dict()
+    partitioned = dict((name, defaultdict(list)) for name in groups)
+    for val in mapping:
+        for desc in mapping[val]:
+            mask = masks.get(desc, 0)
+            if not mask:
+                continue
+            if mask not in selected:
+                selected[mask] = [partitioned[name] for name, group_mask in group_masks.items() if mask & group_mask]
+            for filtered_mapping in selected[mask]:
+                filtered_mapping[val].append(desc)
+    return partitioned
+
 def filterAnnotation(mapping,desired_trees,tree_positions):
     filtered_mapping = defaultdict(list)
     for val in mapping:
@@ -78,96 +156,267 @@ def overlap(set1, set2):
 def num_common(set1, set2):
     return float(len(set1 & set2))
 
-def compute_combined(values, output_folder, filename_modifier, method_key,tree_positions, filter_list):
-    options = {0 : jaccard, 1 : dice, 2: overlap, 3 : num_common}
-    names = {0 : "jaccard", 1 : "dice", 2: "overlap", 3 : "num_common"}
-    print(names[method_key])
-    filtered_values =  filterAnnotation(values,filter_list, tree_positions)
-    name = output_folder + filename_modifier + '_' + names[method_key]
-    #merge them
-    print('Calculating ' + name)
-    with open(name, "w") as out:
-        for d1, d2 in it.combinations(sorted(values.keys()), 2):
-            s1 = set(filtered_values[d1])
-            s2 = set(filtered_values[d2])
-            similarity = options[method_key](s1,s2)
-            if similarity > 0.0:
-                out.write("%s\t%s\t%f\n" % (d1, d2, similarity))
-
-def compute_per_ontology(values,output_folder, key, tree_positions):
-    options = {0 : jaccard, 1 : dice, 2: overlap, 3 : num_common}
-    names = {0 : "jaccard", 1 : "dice", 2: "overlap", 3 : "num_common"}
-
-    available_ontologies = dict([
-        ('A','Anatomy'), ('B','Organisms'),
-        ('C','Diseases'), ('D','Chemicals and Drugs'),
-        ('E','Analytical, Diagnostic and Therapeutic Techniques and Equipment'),
-        ('F','Psychiatry and Psychology'),
-        ('G','Phenomena and Processes'),
-        ('H','Disciplines and Occupations'),
-        ('I','Anthropology, Education, Sociology and Social Phenomena'),
-        ('J','Technology, Industry, Agriculture'),
-        ('K','Humanities'),
-        ('L','Information Science'), ('M','Named Groups'),
-        ('N','Health Care'), ('Z','Geographicals')
-    ])
-    for current_ontology in available_ontologies:
-        name = output_folder + current_ontology + '_' + names[key]
-        filtered_values =  filterAnnotation(values, current_ontology, tree_positions)
-        #bar = progressbar.ProgressBar(maxval = (len(filtered_values.keys())*(len(filtered_values.keys()) - 1))/2, widgets=[progressbar.Bar('*', '[', ']'), ' ', progressbar.SimpleProgress()]).start()
-        #merge them
-        barCounter = 0
-        zero = 0
-        total = 0
-        print('Calculating ' + name)
+#scalar versions of the measures, the vectorized ones are in vectorized_similarity.
+options = {0 : jaccard, 1 : dice, 2: overlap, 3 : num_common}
+names = {0 : "jaccard", 1 : "dice", 2: "overlap", 3 : "num_common", 4 : "cosine", 5 : "tfidf"}
+#measures computed on the multiplicities of the descriptors, see compute_weighted_similarities.
+weighted_measures = {4 : "cosine", 5 : "tfidf"}
+
+#number of diseases (rows) multiplied at once against all the others.
+BLOCK_SIZE = 2000
+
+def weighted_matrix(filtered_values, tfidf=False):
+    """
+    Builds the sparse disease x term matrix of descriptor multiplicities
+    (optionally weighted by the inverse document frequency of each term,
+    log(N/df)), with L2 normalised rows. Diseases follow the order of
+    incidence_matrix.
+    """
+    diseases = sorted([d for d in filtered_values if filtered_values[d]])
+    term_indexes = dict()
+    indptr = [0]
+    indices = []
+    for d in diseases:
+        indices.extend([term_indexes.setdefault(t, len(term_indexes)) for t in filtered_values[d]])
+        indptr.append(len(indices))
+    W = scipy.sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(diseases), len(term_indexes)))
+    #repeated descriptors are added up.
+    W.sum_duplicates()
+    if tfidf:
+        df = np.bincount(W.indices, minlength=W.shape[1])
+        W.data *= np.log(float(len(diseases)) / df[W.indices])
+        W.eliminate_zeros()
+    norms = np.sqrt(np.asarray(W.multiply(W).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    W = scipy.sparse.diags(1.0 / norms) @ W
+    return diseases, W.tocsr()
+
+def compute_weighted_similarities(filtered_values, outputs):
+    """
+    Cosine similarity between the weighted descriptor vectors of every pair
+    of diseases, for the measures in `outputs` (key -> output file name,
+    keys from weighted_measures). Only pairs with nonzero similarity are written.
+    """
+    for key, name in outputs.items():
+        diseases, W = weighted_matrix(filtered_values, tfidf=(weighted_measures[key] == "tfidf"))
+        names_array = np.array(diseases, dtype=object)
         with open(name, "w") as out:
-            for d1, d2 in track(it.combinations(sorted(filtered_values.keys()), 2), descriptions="Computing per ontology..."):
-                s1 = set(filtered_values[d1])
-                s2 = set(filtered_values[d2])
-                similarity = options[key](s1,s2)
-                if similarity > 0.0:
-                    out.write("%s\t%s\t%f\n" % (d1, d2, similarity))
-                else:
-                    zero += 1
-                total += 1
-             #   bar.update(barCounter)
-             #   barCounter+=1
-
-        print(current_ontology + ' zero: ' + str(zero) + ' total: '+  str(total))
-
-help_string = """
-        ---------------------------------------------------------------------------------------------------------------
-        Computes simple similarities based on shared elements (MeSH terms/Publications) for the diseases
-        Usage: 
-        =======
-        sys.argv[0] mapping_file descriptor output_folder
-        \t* mapping_file: Either and OMIM to PubMed mapping or an OMIM to MeSH mapping. Produced by MIM2MESH.py or Pubmed_query.py
-        \t* descriptor_tree_position: Mapping between MeSH descriptors and their tree coordinates. 
-            The file format: MeSHDescriptor\\tCoord1\\tCoord2...\\tCoordN
-        \t* output_folder: Folder where the results will be placed.
-        ---------------------------------------------------------------------------------------------------------------
-        """
+            for rows, cols, similarity in common_pairs(W):
+                keep = similarity > 0
+                out.writelines(["%s\t%s\t%f\n" % line for line in zip(names_array[rows[keep]], names_array[cols[keep]], similarity[keep])])
+
+def incidence_matrix(filtered_values):
+    """
+    Builds the sparse binary disease x term matrix of a mapping. Only the
+    diseases with at least one term are kept, in sorted order (the order in
+    which the pairs are written).
+    """
+    diseases = sorted([d for d in filtered_values if filtered_values[d]])
+    term_indexes = dict()
+    indptr = [0]
+    indices = []
+    for d in diseases:
+        indices.extend([term_indexes.setdefault(t, len(term_indexes)) for t in set(filtered_values[d])])
+        indptr.append(len(indices))
+    X = scipy.sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(diseases), len(term_indexes)))
+    return diseases, X
 
+def common_pairs(X, block_size=BLOCK_SIZE):
+    """
+    Yields, for each block of rows of X, the pairs (i, j), i < j, with at
+    least one common term, and the number of common terms. The intersections
+    of a block with every other row come from a single sparse product X_b.X^T.
+    Pairs are sorted by i, then j.
+    """
+    Xt = X.T.tocsc()
+    for start in range(0, X.shape[0], block_size):
+        common = (X[start:start + block_size] @ Xt).tocoo()
+        rows = common.row + start
+        keep = rows < common.col
+        rows = rows[keep]
+        cols = common.col[keep]
+        values = common.data[keep]
+        order = np.lexsort((cols, rows))
+        yield rows[order], cols[order], values[order]
+
+def vectorized_similarity(key, common, size1, size2):
+    if key == 0:
+        return common / (size1 + size2 - common)
+    if key == 1:
+        return 2 * common / (size1 + size2)
+    if key == 2:
+        return common / np.minimum(size1, size2)
+    return common
+
+def compute_similarities(filtered_values, outputs):
+    """
+    Computes all the measures in `outputs` (key -> output file name) for
+    every pair of diseases, writing only the pairs with nonzero similarity.
+    Returns the number of pairs and the number of pairs with zero similarity.
+    """
+    diseases, X = incidence_matrix(filtered_values)
+    sizes = np.asarray(X.sum(axis=1)).ravel()
+    names_array = np.array(diseases, dtype=object)
+    files = dict((key, open(name, "w")) for key, name in outputs.items())
+    nonzero = 0
+    try:
+        for rows, cols, common in common_pairs(X):
+            nonzero += len(common)
+            for key, out in files.items():
+                similarity = vectorized_similarity(key, common, sizes[rows], sizes[cols])
+                out.writelines(["%s\t%s\t%f\n" % line for line in zip(names_array[rows], names_array[cols], similarity)])
+    finally:
+        for out in files.values():
+            out.close()
+    total = (len(diseases) * (len(diseases) - 1)) // 2
+    return total, total - nonzero
+
+def compute_lsh_jaccard(filtered_values, output, threshold, num_perm=128, bands=None, rescore=False, seed=0, report=False):
+    """
+    Writes the pairs with jaccard >= threshold found by MinHash/LSH (see
+    lsh.py), scored with the MinHash estimate or, if `rescore`, with the
+    exact jaccard. With `report`, the exact pairs above the threshold are
+    also computed to measure the recall and the speed up, which are returned.
+    """
+    diseases, X = incidence_matrix(filtered_values)
+    names_array = np.array(diseases, dtype=object)
+    start = time.time()
+    exact = None
+    if rescore:
+        sets = [set(filtered_values[d]) for d in diseases]
+        exact = lambda i, j: jaccard(sets[i], sets[j])
+    (rows, cols, similarity) = lsh.lsh_jaccard(X, threshold, num_perm, bands, exact, seed)
+    lsh_time = time.time() - start
+    with open(output, "w") as out:
+        out.writelines(["%s\t%s\t%f\n" % line for line in zip(names_array[rows], names_array[cols], similarity)])
+    if not report:
+        return None
+    start = time.time()
+    sizes = np.asarray(X.sum(axis=1)).ravel()
+    expected = []
+    for exact_rows, exact_cols, common in common_pairs(X):
+        exact_similarity = vectorized_similarity(0, common, sizes[exact_rows], sizes[exact_cols])
+        keep = exact_similarity >= threshold
+        expected.append(exact_rows[keep].astype(np.int64) * len(diseases) + exact_cols[keep])
+    exact_time = time.time() - start
+    expected = np.concatenate(expected) if expected else np.array([], dtype=np.int64)
+    found = rows.astype(np.int64) * len(diseases) + cols
+    true_positives = len(np.intersect1d(expected, found))
+    return dict(exact_pairs=len(expected), lsh_pairs=len(found),
+                recall=float(true_positives) / len(expected) if len(expected) else 1.0,
+                precision=float(true_positives) / len(found) if len(found) else 1.0,
+                lsh_time=lsh_time, exact_time=exact_time)
+
+#read-only annotation shared by the worker processes, see init_worker.
+_partitioned = None
+
+def init_worker(partitioned):
+    global _partitioned
+    _partitioned = partitioned
+
+def run_unit(name, outputs, lsh_options=None):
+    """
+    A work unit: all the requested measures (outputs) for one ontology or
+    combination of ontologies. They come from the same sparse product, so
+    they are not split further. `lsh_options` (the arguments of
+    compute_lsh_jaccard, with the output file) adds the approximate jaccard.
+    """
+    start = time.time()
+    if lsh_options:
+        report = compute_lsh_jaccard(_partitioned[name], **lsh_options)
+        if report:
+            print('%s LSH jaccard >= %.2f: recall %.4f precision %.4f, %i pairs in %.2fs (exact: %i pairs in %.2fs)' %
+                  (name, lsh_options['threshold'], report['recall'], report['precision'], report['lsh_pairs'],
+                   report['lsh_time'], report['exact_pairs'], report['exact_time']))
+    weighted_outputs = dict((key, outputs.pop(key)) for key in list(outputs) if key in weighted_measures)
+    (total, zero) = (0, 0)
+    if outputs:
+        (total, zero) = compute_similarities(_partitioned[name], outputs)
+    compute_weighted_similarities(_partitioned[name], weighted_outputs)
+    return (name, total, zero, time.time() - start)
+
+def work_units(unit_names, output_folder, keys=range(4), lsh_options=None):
+    units = []
+    for name in unit_names:
+        unit_lsh = None
+        if lsh_options:
+            unit_lsh = dict(lsh_options, output=output_folder + name + '_jaccard_lsh')
+        units.append((name, dict((key, output_folder + name + '_' + names[key]) for key in keys), unit_lsh))
+    return units
+
+def compute_all(partitioned, output_folder, keys=range(4), jobs=1, lsh_options=None):
+    """
+    Runs every work unit, in `jobs` processes. Each unit writes its own
+    files, so the output does not depend on the number of jobs.
+    """
+    units = work_units(partitioned, output_folder, keys, lsh_options)
+    results = dict()
+    if jobs == 1:
+        init_worker(partitioned)
+        for name, outputs, unit_lsh in track(units, description="Computing similarities..."):
+            results[name] = run_unit(name, outputs, unit_lsh)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(partitioned,)) as executor:
+            futures = [executor.submit(run_unit, name, outputs, unit_lsh) for name, outputs, unit_lsh in units]
+            for future in track(as_completed(futures), total=len(futures), description="Computing similarities..."):
+                result = future.result()
+                results[result[0]] = result
+    for name, _, _ in units:
+        (name, total, zero, elapsed) = results[name]
+        if keys:
+            print('%s zero: %i total: %i (%.2fs)' % (name, zero, total, elapsed))
 
 if __name__ == "__main__":
-    
-    if len(sys.argv) != 4:
-        print(help_string)
-        sys.exit(-1)
-
-    output_folder = sys.argv[3]
-
-    tree_positions = readTreePositions(sys.argv[2])
-    values = read_mapping(sys.argv[1])
-    
-    print('Per ontology ',)
-    for i in range(0,4):
-        compute_per_ontology(values, sys.argv[3], i,tree_positions)
-
-    print('Combined ',)
-    allontologies = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'Z']
-    fiveontologies =  ['A','C','D','E','G']
-    for i in range(0,4):
-        compute_combined(values, output_folder, '5categories', i ,tree_positions, fiveontologies)
-        compute_combined(values, output_folder, 'combinedCategories', i ,tree_positions, allontologies)
+    import argparse
+
+    aparser = argparse.ArgumentParser(description="Computes simple similarities based on shared elements (MeSH terms/Publications) for the diseases")
+    aparser.add_argument("mapping_file",
+                         help="Either and OMIM to PubMed mapping or an OMIM to MeSH mapping. Produced by MIM2MESH.py or Pubmed_query.py")
+    aparser.add_argument("descriptor_tree_position",
+                         help="Mapping between MeSH descriptors and their tree coordinates. "
+                              "The file format: MeSHDescriptor\\tCoord1\\tCoord2...\\tCoordN (ignored with --no-filter)")
+    aparser.add_argument("output_folder", help="Folder where the results will be placed.")
+    aparser.add_argument("--jobs", "-j", type=int, default=1,
+                         help="number of processes computing ontologies in parallel")
+    aparser.add_argument("--measures", nargs="*", choices=list(names.values()),
+                         default=[names[key] for key in names if key not in weighted_measures],
+                         help="measures to compute (default: jaccard dice overlap num_common). cosine and tfidf "
+                              "are cosine similarities of the descriptor multiplicities (plain or TF-IDF weighted), "
+                              "see MIM2MESH.py --weights")
+    aparser.add_argument("--no-filter", action="store_true",
+                         help="use the terms of the mapping as they are, without splitting them by ontology "
+                              "(e.g. PubMed ids from an OMIM to PubMed mapping). Results are written to all_<measure>")
+    lsh_group = aparser.add_argument_group("approximate jaccard (MinHash/LSH)")
+    lsh_group.add_argument("--lsh-threshold", type=float,
+                           help="also write <name>_jaccard_lsh, with the pairs whose jaccard is likely above this threshold")
+    lsh_group.add_argument("--num-perm", type=int, default=128,
+                           help="number of MinHash functions (default: 128)")
+    lsh_group.add_argument("--bands", type=int,
+                           help="number of LSH bands, must divide --num-perm (default: chosen from the threshold)")
+    lsh_group.add_argument("--rescore", action="store_true",
+                           help="score the candidate pairs with the exact jaccard instead of the MinHash estimate")
+    lsh_group.add_argument("--lsh-report", action="store_true",
+                           help="also compute the exact pairs above the threshold and report recall and times")
+    lsh_group.add_argument("--seed", type=int, default=0)
+    args = aparser.parse_args()
+
+    tree_positions = None if args.no_filter else readTreePositions(args.descriptor_tree_position)
+    if set(args.measures) & set(weighted_measures.values()):
+        values = read_mapping_weighted(args.mapping_file)
+    else:
+        values = read_mapping(args.mapping_file)
+
+    if args.no_filter:
+        partitioned = {'all': values}
+    else:
+        #filter the annotation for every ontology and combination at once.
+        groups = dict((ontology, [ontology]) for ontology in available_ontologies)
+        groups.update(combined_ontologies)
+        partitioned = partitionAnnotation(values, tree_positions, groups)
 
+    lsh_options = None
+    if args.lsh_threshold is not None:
+        lsh_options = dict(threshold=args.lsh_threshold, num_perm=args.num_perm, bands=args.bands,
+                           rescore=args.rescore, seed=args.seed, report=args.lsh_report)
+    keys = [key for key in names if names[key] in args.measures]
+    compute_all(partitioned, args.output_folder, keys, args.jobs, lsh_options)